@@ -1,16 +1,23 @@
-from flask import Flask, jsonify, request, render_template
-from bingo_db import (
-    get_cardboard_as_grid,
-    get_called_numbers,
-    check_card_winner,
-    handle_winner,
-    get_user_id,
+from flask import Flask, Response, jsonify, request, render_template, stream_with_context
+from green_db import (
+    get_cardboard_response,
+    get_card_state,
+    claim_win as settle_claim,
     buy_card,
-    get_all_cards_with_status
+    buy_cards,
+    get_available_cards,
+    get_available_cards_since,
+    get_rooms,
+    get_room,
+    DEFAULT_ROOM_ID
 )
+from round_stream import get_broadcaster
 
 app = Flask(__name__)
 
+# Card layouts never change, so their responses may be cached forever.
+CARD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 # ========== WEB PAGES ==========
 @app.route('/')
 def serve_webapp():
@@ -23,35 +30,142 @@ def shop():
     return render_template('shop.html')
 
 # ========== API ENDPOINTS ==========
+# Room-scoped endpoints take ?room=<id> (or "room_id" in JSON bodies) and
+# default to the main room.
+def _room_arg(data=None):
+    """The requested room id, or None if it does not name a room."""
+    room_id = (data or {}).get('room_id') or request.args.get('room') or DEFAULT_ROOM_ID
+    try:
+        room_id = int(room_id)
+    except (TypeError, ValueError):
+        return None
+    return room_id if get_room(room_id) else None
+
+def _card_id(value):
+    """A card id from JSON (int or numeric string) as an int, or None."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+@app.route('/api/rooms')
+def list_rooms():
+    """Return every room with its card price and round duration."""
+    return jsonify(list(get_rooms().values()))
+
 @app.route('/api/card/<int:card_id>')
 def get_card(card_id):
-    """Return the 5x5 grid for the given card ID."""
-    grid = get_cardboard_as_grid(card_id)
-    if grid:
-        return jsonify(grid)
-    return jsonify({"error": "Card not found"}), 404
+    """
+    Return the 5x5 grid for the given card ID (pre-serialized by the catalogue).
+    The response is immutable: it carries a strong ETag, answers If-None-Match
+    with 304 and is sent gzipped when the client accepts it and it helps.
+    """
+    card = get_cardboard_response(card_id, request.accept_encodings['gzip'] > 0)
+    if card is None:
+        return jsonify({"error": "Card not found"}), 404
+    body, etag, encoding = card
+    headers = {"ETag": etag, "Cache-Control": CARD_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
+
+@app.route('/api/state/<int:card_id>')
+def card_state(card_id):
+    """
+    Everything the card viewer needs in one response: grid, called numbers,
+    marked-cell mask (25 bits, row-major), round status and a sequence number
+    (how many numbers have been called). With ?round=<id>&since=<seq> from an
+    earlier response only the numbers called after it are returned, without
+    the grid; a different round or an unknown seq gets the full state.
+    """
+    room_id = _room_arg()
+    if room_id is None:
+        return jsonify({"error": "Room not found"}), 404
+    round_id = request.args.get('round', type=int)
+    since = request.args.get('since', type=int)
+    state = get_card_state(card_id, room_id, round_id, since)
+    if state is None:
+        return jsonify({"error": "Card not found"}), 404
+    response = jsonify(state)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route('/api/cards/available')
 def available_cards():
-    """Return a list of all card IDs that are not yet taken in the current round."""
-    cards = get_all_cards_with_status()
-    available = [{"id": c["id"]} for c in cards if not c["taken"]]
-    return jsonify(available)
+    """
+    Return the IDs of all cards not yet taken, as { "version": ..., "available": [...] }.
+    Supports If-None-Match (the ETag is the version). With ?since=<version> only the
+    changes are returned: { "version": ..., "taken": [...], "freed": [...] }; if that
+    version is too old the full list is returned instead.
+    """
+    room_id = _room_arg()
+    if room_id is None:
+        return jsonify({"error": "Room not found"}), 404
+    since = request.args.get('since')
+    if since:
+        version, changes = get_available_cards_since(since, room_id)
+        if changes is not None:
+            return jsonify({"version": version, **changes})
+
+    version, body = get_available_cards(room_id)
+    etag = f'"{version}"'
+    if request.if_none_match.contains(version):
+        return Response(status=304, headers={"ETag": etag})
+    return Response(body, mimetype='application/json',
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.route('/api/round/stream')
+def round_stream():
+    """
+    Server-Sent Events stream of the room's active round.
+    Events: snapshot (sent first), call, round (status/pause changes), winner.
+    Reconnects resume from the Last-Event-ID header (or ?last_event_id=).
+    Served by gunicorn's gevent worker, where an open stream is one idle
+    greenlet, so thousands of open cards do not starve the other endpoints.
+    """
+    room_id = _room_arg()
+    if room_id is None:
+        return jsonify({"error": "Room not found"}), 404
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(stream_with_context(get_broadcaster(room_id).stream(last_event_id)),
+                    mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/api/buy', methods=['POST'])
 def purchase_card():
     """
-    Purchase a card.
+    Purchase a card, or several in one transaction.
     Expected JSON: { "telegram_id": 123456789, "card_id": 42 }
+               or: { "telegram_id": 123456789, "card_ids": [42, 43, 44] }
+    plus an optional "room_id". The batch form returns one result per card.
     """
     data = request.json
     telegram_id = data.get('telegram_id')
     card_id = data.get('card_id')
+    card_ids = data.get('card_ids')
+    room_id = _room_arg(data)
+    if room_id is None:
+        return jsonify({"success": False, "message": "Room not found"}), 404
+
+    if telegram_id and isinstance(card_ids, list) and card_ids:
+        card_ids = [_card_id(value) for value in card_ids]
+        if None in card_ids:
+            return jsonify({"success": False, "message": "Invalid card_ids"}), 400
+        results = buy_cards(telegram_id, card_ids, room_id)
+        success = any(r["success"] for r in results)
+        return jsonify({"success": success, "results": results}), (200 if success else 400)
 
     if not telegram_id or not card_id:
         return jsonify({"success": False, "message": "Missing telegram_id or card_id"}), 400
+    card_id = _card_id(card_id)
+    if card_id is None:
+        return jsonify({"success": False, "message": "Invalid card_id"}), 400
 
-    success, message = buy_card(telegram_id, card_id)
+    success, message = buy_card(telegram_id, card_id, room_id)
     if success:
         return jsonify({"success": True, "message": message})
     else:
@@ -61,25 +175,22 @@ def purchase_card():
 def claim_win():
     """
     (Optional) Alternative endpoint for win claims directly from the web app.
-    Expected JSON: { "user_id": 123456, "card_id": 42 }
+    Expected JSON: { "user_id": <telegram id>, "card_id": 42, "room_id": 1 (optional) }
+    Simultaneous claims are settled together; only the first winning card is paid.
     """
     data = request.json
     user_id = data.get('user_id')
     card_id = data.get('card_id')
     if not user_id or not card_id:
         return jsonify({"error": "Missing user_id or card_id"}), 400
+    room_id = _room_arg(data)
+    if room_id is None:
+        return jsonify({"error": "Room not found"}), 404
 
-    # Optional: verify user owns this card (you could add a function)
-    called = get_called_numbers()
-    card = get_cardboard_as_grid(card_id)
-    if not card:
-        return jsonify({"error": "Invalid card"}), 404
-
-    if check_card_winner(card, called):
-        result = handle_winner(user_id)
-        return jsonify({"message": result})
-    else:
-        return jsonify({"error": "Not a winner yet"}), 400
+    paid, message = settle_claim(user_id, card_id, room_id)
+    if paid:
+        return jsonify({"message": message})
+    return jsonify({"error": message}), 400
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""Async facade over bingo_db for the Telegram bot.
+
+Every bingo_db call blocks on SQLite, so the bot's handlers await these
+wrappers instead of calling bingo_db directly on the event loop.  Only what
+the bot uses is wrapped.  Writes go
+through a single writer thread (SQLite only allows one writer at a time, so
+more threads would just wait on the lock) and reads through a small bounded
+pool; each thread keeps its own pooled connection.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bingo_db
+
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", "4"))
+DB_CLAIM_THREADS = int(os.getenv("DB_CLAIM_THREADS", "8"))
+DEFAULT_ROOM_ID = bingo_db.DEFAULT_ROOM_ID
+PENDING_PAGE_SIZE = bingo_db.PENDING_PAGE_SIZE
+
+_write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bingo-db-write")
+_read_pool = ThreadPoolExecutor(max_workers=DB_READ_THREADS, thread_name_prefix="bingo-db-read")
+# Win claims wait for each other inside bingo_db (see claim_win), so they get
+# their own threads rather than queueing one by one behind the writer.
+_claim_pool = ThreadPoolExecutor(max_workers=DB_CLAIM_THREADS, thread_name_prefix="bingo-db-claim")
+
+
+def _offload(pool, fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+    return wrapper
+
+
+def _read(fn):
+    return _offload(_read_pool, fn)
+
+
+def _write(fn):
+    return _offload(_write_pool, fn)
+
+
+def shutdown(wait=True):
+    _write_pool.shutdown(wait=wait)
+    _read_pool.shutdown(wait=wait)
+    _claim_pool.shutdown(wait=wait)
+
+
+# ----- Reads -----
+get_user_by_telegram_id = _read(bingo_db.get_user_by_telegram_id)
+get_user_balance = _read(bingo_db.get_user_balance)
+get_user_room = _read(bingo_db.get_user_room)
+get_rooms = _read(bingo_db.get_rooms)
+get_user_cards = _read(bingo_db.get_user_cards)
+get_round_recipients = _read(bingo_db.get_round_recipients)
+get_balance_history = _read(bingo_db.get_balance_history)
+get_free_card_page = _read(bingo_db.get_free_card_page)
+get_called_numbers = _read(bingo_db.get_called_numbers)
+get_active_round = _read(bingo_db.get_active_round)
+get_active_rounds = _read(bingo_db.get_active_rounds)
+get_round_state = _read(bingo_db.get_round_state)
+get_round_result = _read(bingo_db.get_round_result)
+admin_stats = _read(bingo_db.admin_stats)
+get_pending_deposits = _read(bingo_db.get_pending_deposits)
+get_pending_withdrawals = _read(bingo_db.get_pending_withdrawals)
+count_pending_deposits = _read(bingo_db.count_pending_deposits)
+count_pending_withdrawals = _read(bingo_db.count_pending_withdrawals)
+
+# ----- Writes -----
+create_user = _write(bingo_db.create_user)
+set_user_room = _write(bingo_db.set_user_room)
+create_room = _write(bingo_db.create_room)
+buy_card = _write(bingo_db.buy_card)
+call_number = _write(bingo_db.call_number)
+check_round_timeout = _write(bingo_db.check_round_timeout)
+pause_round = _write(bingo_db.pause_round)
+resume_round = _write(bingo_db.resume_round)
+reset_round = _write(bingo_db.reset_round)
+set_card_price = _write(bingo_db.set_card_price)
+rebuild_stats = _write(bingo_db.rebuild_stats)
+verify_ledger = _write(bingo_db.verify_ledger)
+request_deposit = _write(bingo_db.request_deposit)
+approve_deposit = _write(bingo_db.approve_deposit)
+request_withdrawal = _write(bingo_db.request_withdrawal)
+approve_deposits = _write(bingo_db.approve_deposits)
+reject_deposits = _write(bingo_db.reject_deposits)
+approve_withdrawals = _write(bingo_db.approve_withdrawals)
+reject_withdrawals = _write(bingo_db.reject_withdrawals)
+
+# ----- Win claims -----
+claim_win = _offload(_claim_pool, bingo_db.claim_win)
@@ -0,0 +1,55 @@
+"""Microbenchmark: bitmask check_card_winner vs the original set/loop version.
+
+Run from the repository root:  python -m benchmarks.winner_check
+A throwaway database is used unless RAILWAY_VOLUME_MOUNT_PATH is set.
+"""
+import os
+import random
+import tempfile
+import timeit
+
+os.environ.setdefault("RAILWAY_VOLUME_MOUNT_PATH", tempfile.mkdtemp(prefix="bingo_bench_"))
+
+import bingo_db  # noqa: E402
+
+
+def legacy_check_card_winner(card, called_numbers):
+    called = set(called_numbers)
+    for row in card:
+        if all(cell == "FREE" or cell in called for cell in row):
+            return True
+    for col in range(5):
+        if all(card[row][col] == "FREE" or card[row][col] in called for row in range(5)):
+            return True
+    return False
+
+
+def main(draws=30, repeat=5, number=200):
+    catalogue = bingo_db.get_card_catalogue()
+    grids = [catalogue.grid(card_id) for card_id in catalogue.ids]
+    called = random.Random(75).sample(range(1, 76), draws)
+    bitmap = bingo_db.called_bitmap(called)
+
+    # Sanity: both implementations must agree on every card.
+    for grid in grids:
+        assert legacy_check_card_winner(grid, called) == bingo_db.check_card_winner(grid, called)
+
+    cases = [
+        ("legacy (set + generators)", lambda: [legacy_check_card_winner(g, called) for g in grids]),
+        ("bitmask, list input", lambda: [bingo_db.check_card_winner(g, called) for g in grids]),
+        ("bitmask, shared bitmap", lambda: [bingo_db.check_card_winner(g, bitmap) for g in grids]),
+        ("bitmask, catalogue masks", lambda: [bingo_db.masks_win(catalogue.line_masks(i), bitmap)
+                                              for i in catalogue.ids]),
+    ]
+    checks = len(grids) * number
+    baseline = None
+    print(f"{len(grids)} cards, {draws} numbers called, {checks} checks per run")
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, repeat=repeat, number=number))
+        per_check = best / checks * 1e9
+        baseline = baseline or per_check
+        print(f"{name:28s} {per_check:9.0f} ns/check  x{baseline / per_check:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,22 @@ import sqlite3
 import json
 import random
 import os
-from datetime import datetime
+import secrets
+import threading
+import time
+import calendar
+import gzip
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:   # batched evaluation falls back to the bitmask engine
+    np = None
 
 # ========== CONFIGURATION ==========
 # Use Railway volume mount path if available, otherwise default to /data
@@ -15,6 +30,19 @@ DEFAULT_CARD_PRICE = 20
 DEFAULT_HOUSE_PERCENT = 10
 DEFAULT_WITHDRAWAL_FEE_PERCENT = 5
 DEFAULT_ROUND_DURATION = 300   # seconds
+DEFAULT_ROOM_ID = 1            # the "Main" room every existing round belongs to
+
+# SQLite tuning (applied to every pooled connection)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_STATEMENT_CACHE_SIZE = 256
+AVAILABILITY_LOG_SIZE = 1024   # card sale/free events kept for ?since= deltas
+BATCH_APPROVAL_LIMIT = 100     # default N for "approve/reject all pending"
+PENDING_PAGE_SIZE = 20         # rows per page of the admin pending queues
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = 300           # seconds a cached user row is trusted
+CLAIM_WINDOW_SECONDS = 0.2     # simultaneous win claims collected before settling
+CLAIM_WAIT_SECONDS = 30        # longest a claim waits for another thread to settle it
 
 # Ensure the database directory exists
 db_dir = os.path.dirname(DB_PATH)
@@ -44,6 +72,9 @@ except Exception as e:
 # ================================
 
 # ========== 200 FIXED UNIQUE CARDS ==========
+# Hand-picked cards; init_db tops the set up to INITIAL_CARD_COUNT with cards
+# from card_generator (fixed seed, so every fresh database gets the same ones).
+INITIAL_CARD_COUNT = 200
 ALL_CARDS = {
   1: [14,12,10,5,9, 17,27,29,20,28, 35,31,"FREE",43,44, 49,58,46,53,54, 65,67,75,72,68],
   2: [7,13,2,11,4, 23,26,29,17,24, 35,40,"FREE",41,37, 60,53,47,57,49, 65,70,63,64,72],
@@ -60,14 +91,291 @@ ALL_CARDS = {
 }
 
 # ========== DATABASE CONNECTION ==========
+# Every thread (Flask workers, the bot thread, executor threads) keeps one
+# long-lived connection.  get_connection() hands out that thread's handle, so
+# helpers called from inside another function reuse the caller's connection
+# instead of opening their own.  close() only releases the handle.  Under the
+# API's gevent worker threading.local is per greenlet, so the API calls in
+# through green_db, which runs them on a few native threads.
+_local = threading.local()
+
+class PooledConnection:
+    """Thread-local wrapper around a sqlite3 connection.
+
+    commit()/close() are deferred while a transaction() block is open, so
+    nested helpers join the outer transaction instead of ending it early.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.pid = os.getpid()
+        self.depth = 0
+        self.data_version = None    # first sync_external_changes() reads change_log
+        self.changes = raw.total_changes
+        self.logging = _install_change_triggers(raw)
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def execute(self, sql, params=()):
+        return self.raw.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.raw.executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self):
+        return self.raw.in_transaction
+
+    def commit(self):
+        if self.depth == 0:
+            self._commit()
+
+    def _commit(self):
+        # After a write the change_log rows it added (and any older ones) are
+        # applied right away, so log-driven caches include this commit.
+        wrote = self.raw.in_transaction and self.raw.total_changes != self.changes
+        if wrote and self.logging:
+            _prune_change_log(self.raw)
+        try:
+            self.raw.commit()
+        finally:
+            self.changes = self.raw.total_changes
+        if wrote:
+            _apply_change_log(self.raw)
+
+    def _rollback(self):
+        self.raw.rollback()
+        self.changes = self.raw.total_changes
+
+    def rollback(self):
+        # Inside nested transaction() blocks only the innermost block is undone.
+        if self.depth > 1:
+            self.raw.execute(f"ROLLBACK TO SAVEPOINT sp{self.depth - 1}")
+        else:
+            self._rollback()
+
+    def close(self):
+        # Same semantics as closing a real connection: uncommitted work is lost.
+        if self.depth == 0 and self.raw.in_transaction:
+            self._rollback()
+
+def _open_connection():
+    raw = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                          cached_statements=DB_STATEMENT_CACHE_SIZE)
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    raw.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    raw.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    raw.execute("PRAGMA temp_store=MEMORY")
+    return raw
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    conn = getattr(_local, "conn", None)
+    # A forked worker must not reuse the parent's connection.
+    if conn is None or conn.pid != os.getpid():
+        conn = _local.conn = PooledConnection(_open_connection())
+    elif not conn.logging:
+        conn.logging = _install_change_triggers(conn.raw)
+    return conn
+
+def close_connection():
+    """Really close this thread's connection (e.g. on worker shutdown)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.raw.close()
+
+@contextmanager
+def transaction(immediate=False):
+    """Run a block in one transaction on this thread's connection.
+
+    Nested blocks become savepoints, so helpers can use transaction() freely
+    and still be composed into a caller's transaction.  immediate=True takes
+    the write lock up front (BEGIN IMMEDIATE) for read-then-write sequences.
+    """
+    conn = get_connection()
+    savepoint = f"sp{conn.depth}"
+    if conn.depth > 0:
+        conn.raw.execute(f"SAVEPOINT {savepoint}")
+    elif not conn.raw.in_transaction:
+        conn.raw.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    conn.depth += 1
+    try:
+        yield conn
+    except BaseException:
+        conn.depth -= 1
+        if conn.depth > 0:
+            conn.raw.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            conn.raw.execute(f"RELEASE SAVEPOINT {savepoint}")
+        elif conn.raw.in_transaction:
+            conn._rollback()
+        raise
+    else:
+        conn.depth -= 1
+        if conn.depth > 0:
+            conn.raw.execute(f"RELEASE SAVEPOINT {savepoint}")
+        else:
+            conn._commit()
+
+# ========== IN-PROCESS CACHES ==========
+# The API and the bot can run as separate processes on the same database.
+# In-process state is kept current write-through by this process's own writes,
+# from whichever thread.  Changes made by other processes arrive through
+# change_log: TEMP triggers on every connection append one row per changed
+# user, sold/freed card, round, called number and room setting, tagged with the
+# writing process.  When a connection's PRAGMA data_version moves (someone else
+# committed), the rows after the last one seen are read and handed to the
+# handlers registered for their topic, which patch or drop just the affected
+# entries.  Rows of this process are passed on too (own=True), for caches
+# that are driven by the log rather than written through.  If rows were pruned
+# before this process saw them, every registered cache is dropped instead.
+# Write-through updates and handlers must therefore be idempotent.
+CHANGE_LOG_KEEP = 50000        # change_log rows kept for slow readers
+CHANGE_LOG_PRUNE_EVERY = 1000  # write commits between prunes
+
+_cache_resetters = []
+_change_handlers = {}      # topic -> [handler(log_id, room_id, key, value, own)]
+_change_log_lock = threading.Lock()
+_change_log_seen = None    # id of the last change_log row applied in this process
+_writer = None             # (pid, token) tagging this process's change_log rows
+_commits_since_prune = 0
+
+def register_cache(reset):
+    _cache_resetters.append(reset)
+    return reset
+
+def register_change_handler(topic):
+    def register(handler):
+        _change_handlers.setdefault(topic, []).append(handler)
+        return handler
+    return register
+
+def invalidate_caches():
+    for reset in _cache_resetters:
+        reset()
+
+def _writer_token():
+    global _writer
+    if _writer is None or _writer[0] != os.getpid():
+        _writer = (os.getpid(), f"{os.getpid()}-{secrets.token_hex(4)}")
+    return _writer[1]
+
+# (trigger name, event, topic, room_id, key, value) of the TEMP triggers
+_CHANGE_TRIGGERS = [
+    ("log_user_update", "UPDATE ON users", "user", "NULL", "NEW.id", "NULL"),
+    ("log_user_delete", "DELETE ON users", "user", "NULL", "OLD.id", "NULL"),
+    ("log_card_insert", "INSERT ON user_cards", "card", "NEW.room_id", "NEW.cardboard_id", "NEW.user_id"),
+    ("log_card_delete", "DELETE ON user_cards", "card", "OLD.room_id", "OLD.cardboard_id", "NULL"),
+    ("log_round_insert", "INSERT ON game_rounds", "round_start", "NEW.room_id", "NEW.id", "NULL"),
+    ("log_round_update", "UPDATE OF status, is_paused, paused_seconds, prize_pool, duration_seconds, started_at ON game_rounds",
+     "round", "NEW.room_id", "NEW.id", "NULL"),
+    ("log_call_insert", "INSERT ON called_numbers", "call", "NEW.room_id", "NEW.round_id", "NEW.number"),
+    ("log_room_insert", "INSERT ON rooms", "room", "NEW.id", "NULL", "NULL"),
+    ("log_room_update", "UPDATE ON rooms", "room", "NEW.id", "NULL", "NULL"),
+    ("log_settings_update", "UPDATE ON game_settings", "room", "NULL", "NULL", "NULL"),
+]
+
+def _install_change_triggers(raw):
+    """Create this connection's TEMP change_log triggers; False until init_db() is done.
+
+    Triggers on the old schema would break init_db()'s table rebuilds.
+    """
+    if _change_log_seen is None:
+        return False
+    writer = _writer_token()
+    try:
+        for name, event, topic, room_id, key, value in _CHANGE_TRIGGERS:
+            raw.execute(f'''CREATE TEMP TRIGGER IF NOT EXISTS {name} AFTER {event} BEGIN
+                              INSERT INTO change_log (topic, room_id, key, value, writer)
+                              VALUES ('{topic}', {room_id}, {key}, {value}, '{writer}');
+                          END''')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def log_change(c, topic, room_id=None, key=None, value=None):
+    """Append a change_log row by hand, for changes the triggers do not cover."""
+    c.execute("INSERT INTO change_log (topic, room_id, key, value, writer) VALUES (?, ?, ?, ?, ?)",
+              (topic, room_id, key, value, _writer_token()))
+
+def _start_change_log(c):
+    global _change_log_seen
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    with _change_log_lock:
+        _change_log_seen = c.fetchone()[0]
+
+def _prune_change_log(raw):
+    global _commits_since_prune
+    _commits_since_prune += 1
+    if _commits_since_prune >= CHANGE_LOG_PRUNE_EVERY:
+        _commits_since_prune = 0
+        horizon = raw.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0] - CHANGE_LOG_KEEP
+        if horizon > 0:
+            raw.execute("DELETE FROM change_log WHERE id <= ?", (horizon,))
+            log_change(raw, "pruned", key=horizon)     # rows up to key are gone
+
+def _apply_change_log(raw):
+    global _change_log_seen
+    writer = _writer_token()
+    with _change_log_lock:
+        if _change_log_seen is None:
+            return
+        rows = raw.execute('''SELECT id, topic, room_id, key, value, writer FROM change_log
+                              WHERE id > ? ORDER BY id''', (_change_log_seen,)).fetchall()
+        if not rows:
+            return
+        _change_log_seen, first = rows[-1][0], _change_log_seen
+        if rows[0][0] != first + 1:
+            # Pruned before we read them: nothing cached can be trusted.
+            invalidate_caches()
+            return
+        try:
+            for log_id, topic, room_id, key, value, row_writer in rows:
+                for handler in _change_handlers.get(topic, ()):
+                    handler(log_id, room_id, key, value, row_writer == writer)
+        except Exception as e:
+            print(f"⚠️ Applying change_log failed, dropping caches: {e}")
+            invalidate_caches()
+
+@register_change_handler("all")
+def _on_reset(log_id, room_id, key, value, own):
+    if not own:
+        invalidate_caches()
+
+def sync_external_changes():
+    conn = get_connection()
+    # Uncommitted rows of this connection must not be taken as seen.
+    if conn.raw.in_transaction and conn.raw.total_changes != conn.changes:
+        return
+    version = conn.raw.execute("PRAGMA data_version").fetchone()[0]
+    if version == conn.data_version:
+        return
+    conn.data_version = version
+    _apply_change_log(conn.raw)
 
 # ========== INITIALISATION ==========
+def _add_column_if_missing(c, table, column, declaration):
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
 def init_db():
     conn = get_connection()
     c = conn.cursor()
 
+    # ----- Change log (read by other processes, see IN-PROCESS CACHES) -----
+    c.execute('''CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        room_id INTEGER,
+        key INTEGER,
+        value INTEGER,
+        writer TEXT
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_topic ON change_log(topic, room_id, id)')
+    c.execute("DROP TABLE IF EXISTS change_counter")
+
     # ----- Users -----
     c.execute('''CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -75,8 +383,20 @@ def init_db():
         username TEXT,
         balance INTEGER DEFAULT 0,
         total_deposited INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        room_id INTEGER DEFAULT 1
+    )''')
+    _add_column_if_missing(c, "users", "room_id", "INTEGER DEFAULT 1")
+
+    # ----- Rooms (independent games; NULL settings fall back to the defaults) -----
+    c.execute('''CREATE TABLE IF NOT EXISTS rooms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        card_price INTEGER,
+        duration_seconds INTEGER,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
+    c.execute("INSERT OR IGNORE INTO rooms (id, name) VALUES (?, 'Main')", (DEFAULT_ROOM_ID,))
 
     # ----- Game rounds -----
     c.execute('''CREATE TABLE IF NOT EXISTS game_rounds (
@@ -86,8 +406,20 @@ def init_db():
         status TEXT DEFAULT 'active',
         prize_pool INTEGER DEFAULT 0,
         duration_seconds INTEGER DEFAULT 300,
-        is_paused INTEGER DEFAULT 0
+        is_paused INTEGER DEFAULT 0,
+        paused_at TIMESTAMP,
+        paused_seconds INTEGER DEFAULT 0,
+        draw_order BLOB,
+        draw_cursor INTEGER DEFAULT 0,
+        winner_user_id INTEGER,
+        room_id INTEGER NOT NULL DEFAULT 1 REFERENCES rooms(id)
     )''')
+    _add_column_if_missing(c, "game_rounds", "draw_order", "BLOB")
+    _add_column_if_missing(c, "game_rounds", "draw_cursor", "INTEGER DEFAULT 0")
+    _add_column_if_missing(c, "game_rounds", "winner_user_id", "INTEGER")
+    _add_column_if_missing(c, "game_rounds", "room_id", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(c, "game_rounds", "paused_at", "TIMESTAMP")
+    _add_column_if_missing(c, "game_rounds", "paused_seconds", "INTEGER DEFAULT 0")
 
     # ----- Game settings (single row) -----
     c.execute('''CREATE TABLE IF NOT EXISTS game_settings (
@@ -97,21 +429,35 @@ def init_db():
         withdrawal_fee_percent INTEGER DEFAULT 5
     )''')
 
-    # ----- Cardboards (fixed 200 cards) -----
+    # ----- Cardboards (200 initial cards, more via card_generator) -----
     c.execute('''CREATE TABLE IF NOT EXISTS cardboards (
         id INTEGER PRIMARY KEY,
         numbers TEXT NOT NULL
     )''')
 
-    # ----- Active cards for the current round -----
+    # ----- Active cards for the current round of each room -----
+    c.execute("PRAGMA table_info(user_cards)")
+    user_card_columns = {row[1] for row in c.fetchall()}
+    if user_card_columns and "room_id" not in user_card_columns:
+        # The old table had a global UNIQUE(cardboard_id), which SQLite cannot
+        # drop in place: rebuild it, moving every existing card to the main room.
+        c.execute("ALTER TABLE user_cards RENAME TO user_cards_old")
     c.execute('''CREATE TABLE IF NOT EXISTS user_cards (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
-        cardboard_id INTEGER UNIQUE,
+        cardboard_id INTEGER,
         purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        room_id INTEGER NOT NULL DEFAULT 1,
         FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (cardboard_id) REFERENCES cardboards(id)
+        FOREIGN KEY (cardboard_id) REFERENCES cardboards(id),
+        FOREIGN KEY (room_id) REFERENCES rooms(id),
+        UNIQUE(room_id, cardboard_id)
     )''')
+    if user_card_columns and "room_id" not in user_card_columns:
+        c.execute('''INSERT INTO user_cards (id, user_id, cardboard_id, purchased_at, room_id)
+                     SELECT id, user_id, cardboard_id, purchased_at, ? FROM user_cards_old''',
+                  (DEFAULT_ROOM_ID,))
+        c.execute("DROP TABLE user_cards_old")
 
     # ----- Permanent purchase history (per round) -----
     c.execute('''CREATE TABLE IF NOT EXISTS card_purchase_history (
@@ -120,9 +466,15 @@ def init_db():
         user_id INTEGER,
         cardboard_id INTEGER,
         purchased_at TIMESTAMP,
+        price INTEGER,
         FOREIGN KEY (round_id) REFERENCES game_rounds(id),
         FOREIGN KEY (user_id) REFERENCES users(id)
     )''')
+    c.execute("PRAGMA table_info(card_purchase_history)")
+    backfill_prices = "price" not in {row[1] for row in c.fetchall()}
+    if backfill_prices:
+        # Filled in from the ledger once it exists (see below).
+        c.execute("ALTER TABLE card_purchase_history ADD COLUMN price INTEGER")
 
     # ----- Called numbers per round -----
     c.execute('''CREATE TABLE IF NOT EXISTS called_numbers (
@@ -130,9 +482,11 @@ def init_db():
         round_id INTEGER,
         number INTEGER,
         called_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        room_id INTEGER DEFAULT 1,
         FOREIGN KEY (round_id) REFERENCES game_rounds(id),
         UNIQUE(round_id, number)
     )''')
+    _add_column_if_missing(c, "called_numbers", "room_id", "INTEGER DEFAULT 1")
 
     # ----- Payments (deposits) -----
     c.execute('''CREATE TABLE IF NOT EXISTS payments (
@@ -170,25 +524,81 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
 
+    # ----- Balance ledger (append-only, one row per balance change) -----
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'balance_ledger'")
+    ledger_is_new = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS balance_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        delta INTEGER NOT NULL,
+        balance_after INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        ref TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+    if ledger_is_new:
+        # Balances that predate the ledger become its opening entries.
+        c.execute('''INSERT INTO balance_ledger (user_id, delta, balance_after, reason)
+                     SELECT id, balance, balance, 'opening' FROM users WHERE balance != 0''')
+    elif backfill_prices:
+        # Recover what was actually paid from the ledger where it has the purchase.
+        c.execute('''UPDATE card_purchase_history SET price = -balance_ledger.delta
+                     FROM balance_ledger
+                     WHERE balance_ledger.reason = 'card_purchase'
+                       AND balance_ledger.ref = card_purchase_history.round_id || ':' ||
+                                                card_purchase_history.cardboard_id''')
+
+    # ----- Verified balance checkpoints (replay starts after the latest one) -----
+    c.execute('''CREATE TABLE IF NOT EXISTS balance_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        ledger_id INTEGER NOT NULL,
+        balance INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+
+    # ----- Running totals for admin_stats (single row) -----
+    c.execute('''CREATE TABLE IF NOT EXISTS stats_counters (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_users INTEGER DEFAULT 0,
+        total_deposits INTEGER DEFAULT 0,
+        total_rounds INTEGER DEFAULT 0,
+        total_house_earnings INTEGER DEFAULT 0
+    )''')
+
     # Indexes
     c.execute('CREATE INDEX IF NOT EXISTS idx_user_cards_user_id ON user_cards(user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_cards_room_user ON user_cards(room_id, user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_game_rounds_room_status ON game_rounds(room_id, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_game_rounds_status ON game_rounds(status)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status)')
+    c.execute('DROP INDEX IF EXISTS idx_payments_status')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_payments_status_id ON payments(status, id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_user_id ON withdrawals(user_id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_status ON withdrawals(status)')
+    c.execute('DROP INDEX IF EXISTS idx_withdrawals_status')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_status_id ON withdrawals(status, id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_called_numbers_round ON called_numbers(round_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_history_round ON card_purchase_history(round_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ledger_user ON balance_ledger(user_id, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_user ON balance_snapshots(user_id, ledger_id)')
 
     conn.commit()
 
     # Load fixed cards if empty (using INSERT OR IGNORE to avoid duplicates)
     c.execute("SELECT COUNT(*) FROM cardboards")
     if c.fetchone()[0] == 0:
-        for cid, nums in ALL_CARDS.items():
-            c.execute("INSERT OR IGNORE INTO cardboards (id, numbers) VALUES (?, ?)",
-                      (cid, json.dumps(nums)))
+        from card_generator import generate_cards
+        cards = dict(ALL_CARDS)
+        free_ids = (cid for cid in range(1, INITIAL_CARD_COUNT + 1) if cid not in cards)
+        extra = generate_cards(INITIAL_CARD_COUNT - len(cards), seed=INITIAL_CARD_COUNT,
+                               existing=cards.values())
+        cards.update(zip(free_ids, extra))
+        c.executemany("INSERT OR IGNORE INTO cardboards (id, numbers) VALUES (?, ?)",
+                      [(cid, json.dumps(nums)) for cid, nums in sorted(cards.items())])
         conn.commit()
-        print("✅ 200 cards loaded into database.")
+        print(f"✅ {len(cards)} cards loaded into database.")
 
     # Insert default game settings if missing
     c.execute("SELECT COUNT(*) FROM game_settings")
@@ -199,23 +609,132 @@ def init_db():
         conn.commit()
         print("✅ Default game settings loaded.")
 
-    # Start an initial round if no active round exists
-    c.execute("SELECT id FROM game_rounds WHERE status = 'active'")
-    if not c.fetchone():
-        c.execute('''INSERT INTO game_rounds (status, duration_seconds)
-                     VALUES ('active', ?)''', (DEFAULT_ROUND_DURATION,))
+    # Start an initial round in every room without an active one
+    c.execute('''SELECT id, COALESCE(duration_seconds, ?) FROM rooms
+                 WHERE NOT EXISTS (SELECT 1 FROM game_rounds
+                                   WHERE room_id = rooms.id AND status = 'active')''',
+              (DEFAULT_ROUND_DURATION,))
+    idle_rooms = c.fetchall()
+    for room_id, duration in idle_rooms:
+        c.execute('''INSERT INTO game_rounds (status, duration_seconds, draw_order, room_id)
+                     VALUES ('active', ?, ?, ?)''', (duration, new_draw_order(), room_id))
+        _bump_stats(c, total_rounds=1)
+    if idle_rooms:
         conn.commit()
         print("✅ Initial game round started.")
 
+    # Seed the running totals from the base tables the first time
+    c.execute("SELECT COUNT(*) FROM stats_counters")
+    if c.fetchone()[0] == 0:
+        _rebuild_stats(c)
+        conn.commit()
+        print("✅ Stats counters built.")
+
+    # Other running processes cannot tell what changed here: have them start over.
+    _start_change_log(c)
+    conn.logging = _install_change_triggers(conn.raw)
+    log_change(c, "all")
+    conn.commit()
     conn.close()
 
 # ========== USER FUNCTIONS ==========
+# ----- User cache -----
+# (id, telegram_id, username, balance, room_id) by telegram_id, LRU-bounded
+# and expiring after USER_CACHE_TTL.  Every function that changes a balance
+# writes the new value through once it has committed; a user changed by
+# another process is dropped from the cache.  Every such update bumps a
+# generation, and a row read before the generation moved is not cached: its
+# SELECT may have overlapped a commit whose write-through found no entry.
+_user_cache = OrderedDict()      # telegram_id -> (expires_at, row)
+_user_cache_ids = {}             # users.id -> telegram_id
+_user_cache_lock = threading.Lock()
+_user_cache_generation = 0
+
+@register_cache
+def _reset_user_cache():
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache.clear()
+        _user_cache_ids.clear()
+        _user_cache_generation += 1
+
+def _cache_user(row, generation):
+    with _user_cache_lock:
+        if generation != _user_cache_generation:
+            return
+        _user_cache[row[1]] = (time.monotonic() + USER_CACHE_TTL, row)
+        _user_cache.move_to_end(row[1])
+        _user_cache_ids[row[0]] = row[1]
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _, (_, old) = _user_cache.popitem(last=False)
+            _user_cache_ids.pop(old[0], None)
+
+def _cached_user(telegram_id):
+    with _user_cache_lock:
+        entry = _user_cache.get(telegram_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _user_cache[telegram_id]
+            _user_cache_ids.pop(entry[1][0], None)
+            return None
+        _user_cache.move_to_end(telegram_id)
+        return entry[1]
+
+def _update_cached_user(user_id, **changes):
+    global _user_cache_generation
+    positions = {"balance": 3, "room_id": 4}
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        telegram_id = _user_cache_ids.get(user_id)
+        entry = _user_cache.get(telegram_id) if telegram_id is not None else None
+        if entry is None:
+            return
+        row = list(entry[1])
+        for name, value in changes.items():
+            row[positions[name]] = value
+        _user_cache[telegram_id] = (entry[0], tuple(row))
+
+def _forget_cached_user(user_id):
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        telegram_id = _user_cache_ids.pop(user_id, None)
+        if telegram_id is not None:
+            _user_cache.pop(telegram_id, None)
+
+@register_change_handler("user")
+def _on_user_changed(log_id, room_id, key, value, own):
+    if not own:
+        _forget_cached_user(key)
+
+def _balances_changed(balances):
+    """Write {user_id: new balance} through to the cache after a commit.
+
+    Called while an outer transaction is still open the outcome is unknown,
+    so the entries are dropped instead.
+    """
+    committed = not get_connection().in_transaction
+    for user_id, balance in balances.items():
+        if committed:
+            _update_cached_user(user_id, balance=balance)
+        else:
+            _forget_cached_user(user_id)
+
 def get_user_by_telegram_id(telegram_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-    row = c.fetchone()
-    conn.close()
+    """(id, telegram_id, username, balance, room_id) or None; served from the cache."""
+    sync_external_changes()
+    row = _cached_user(telegram_id)
+    if row is None:
+        generation = _user_cache_generation
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("SELECT id, telegram_id, username, balance, room_id FROM users WHERE telegram_id = ?",
+                  (telegram_id,))
+        row = c.fetchone()
+        conn.close()
+        if row is not None and not conn.in_transaction:
+            _cache_user(row, generation)
     return row
 
 def create_user(telegram_id, username):
@@ -223,8 +742,9 @@ def create_user(telegram_id, username):
     c = conn.cursor()
     c.execute("INSERT INTO users (telegram_id, username, balance) VALUES (?, ?, 0)",
               (telegram_id, username))
-    conn.commit()
     user_id = c.lastrowid
+    _bump_stats(c, total_users=1)
+    conn.commit()
     conn.close()
     return user_id
 
@@ -237,270 +757,1207 @@ def get_user_balance(telegram_id):
     return user[3] if user else 0
 
 def update_user_balance(telegram_id, new_balance):
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, balance FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = c.fetchone()
+        if not row:
+            return
+        user_id, old_balance = row
+        c.execute("UPDATE users SET balance = ? WHERE id = ?", (new_balance, user_id))
+        _record_balance_change(c, user_id, new_balance - old_balance, 'adjustment')
+    _balances_changed({user_id: new_balance})
+
+# ========== BALANCE LEDGER ==========
+# Every balance change appends a signed entry in the same transaction, carrying
+# the resulting balance, so a user's history is a keyset read on
+# (user_id, id).  verify_ledger() replays all entries after each user's latest
+# snapshot in one grouped query and checks the sums against users.balance.
+def _ledger_mark(c):
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM balance_ledger")
+    return c.fetchone()[0]
+
+def _ledger_balances_since(c, ledger_id):
+    """{user_id: latest balance_after} of the entries after ledger_id (set-based writers)."""
+    c.execute("SELECT user_id, balance_after FROM balance_ledger WHERE id > ? ORDER BY id", (ledger_id,))
+    return dict(c.fetchall())
+
+def _record_balance_change(c, user_id, delta, reason, ref=None):
+    # Must run after the UPDATE of users.balance so balance_after is the new value.
+    c.execute('''INSERT INTO balance_ledger (user_id, delta, balance_after, reason, ref)
+                 SELECT id, ?, balance, ?, ? FROM users WHERE id = ?''',
+              (delta, reason, None if ref is None else str(ref), user_id))
+
+def get_balance_history(telegram_id, before_id=None, limit=10):
+    """Newest-first ledger page: [(id, delta, balance_after, reason, ref, created_at)].
+
+    Pass the smallest id of the previous page as before_id for the next one.
+    """
     conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE users SET balance = ? WHERE telegram_id = ?", (new_balance, telegram_id))
-    conn.commit()
+    c.execute('''SELECT balance_ledger.id, delta, balance_after, reason, ref, balance_ledger.created_at
+                 FROM balance_ledger
+                 WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?) AND balance_ledger.id < ?
+                 ORDER BY balance_ledger.id DESC LIMIT ?''',
+              (telegram_id, before_id if before_id is not None else 2 ** 63 - 1, limit))
+    rows = c.fetchall()
     conn.close()
+    return rows
 
-# ========== CARD FUNCTIONS ==========
-def get_cardboard(card_id):
+def verify_ledger(checkpoint=False):
+    """Return [(user_id, balance, replayed)] for users whose ledger disagrees.
+
+    With checkpoint=True and no mismatches, the current balance of every user
+    with ledger entries since their last snapshot is recorded as a new snapshot,
+    so the next run only replays newer entries.
+    """
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            WITH latest AS (
+                SELECT user_id, MAX(ledger_id) AS ledger_id FROM balance_snapshots GROUP BY user_id
+            ), base AS (
+                SELECT users.id AS user_id, users.balance,
+                       COALESCE(s.ledger_id, 0) AS ledger_id, COALESCE(s.balance, 0) AS start
+                FROM users
+                LEFT JOIN latest ON latest.user_id = users.id
+                LEFT JOIN balance_snapshots s
+                       ON s.id = (SELECT MAX(id) FROM balance_snapshots
+                                  WHERE user_id = latest.user_id AND ledger_id = latest.ledger_id)
+            )
+            SELECT base.user_id, base.balance, base.start + COALESCE(SUM(l.delta), 0) AS replayed
+            FROM base
+            LEFT JOIN balance_ledger l ON l.user_id = base.user_id AND l.id > base.ledger_id
+            GROUP BY base.user_id
+            HAVING replayed != base.balance
+        ''')
+        mismatches = c.fetchall()
+        if checkpoint and not mismatches:
+            c.execute('''INSERT INTO balance_snapshots (user_id, ledger_id, balance)
+                         SELECT users.id, COALESCE(MAX(l.id), 0), users.balance
+                         FROM users LEFT JOIN balance_ledger l ON l.user_id = users.id
+                         GROUP BY users.id
+                         HAVING COALESCE(MAX(l.id), 0) > COALESCE(
+                             (SELECT MAX(ledger_id) FROM balance_snapshots s
+                              WHERE s.user_id = users.id), -1)''')
+    return mismatches
+
+# ========== CARD CATALOGUE ==========
+# Cards never change once loaded, so they are decoded once per process into a
+# compact array (25 cells per card, FREE stored as FREE_CELL) with the grid
+# views and the /api/card JSON body precomputed.  Lookups never hit SQLite.
+# The body's ETag (a hash of its bytes, so it survives reloads and restarts)
+# and its gzip variant are computed on first request and kept.
+FREE_CELL = 0
+
+class CardCatalogue:
+    """Immutable, process-wide view of every cardboard."""
+
+    def __init__(self, rows):
+        self.ids = []
+        self.cells = array('B')
+        self._slots = {}
+        self._numbers = {}
+        self._grids = {}
+        self._json = {}
+        self._etags = {}
+        self._gzip = {}
+        self._masks = {}
+        self._array = None
+        for card_id, numbers in rows:
+            self._add(card_id, numbers)
+
+    def _add(self, card_id, numbers):
+        numbers = tuple(numbers)
+        grid = tuple(numbers[row * 5:row * 5 + 5] for row in range(5))
+        self._slots[card_id] = len(self.ids)
+        self.ids.append(card_id)
+        self.cells.extend(FREE_CELL if n == "FREE" else n for n in numbers)
+        self._numbers[card_id] = numbers
+        self._grids[card_id] = grid
+        self._json[card_id] = json.dumps(grid, separators=(",", ":")).encode()
+
+    def __contains__(self, card_id):
+        return card_id in self._slots
+
+    def __len__(self):
+        return len(self.ids)
+
+    def slot(self, card_id):
+        return self._slots.get(card_id)
+
+    def numbers(self, card_id):
+        return self._numbers.get(card_id)
+
+    def grid(self, card_id):
+        return self._grids.get(card_id)
+
+    def grid_json(self, card_id):
+        return self._json.get(card_id)
+
+    def json_etag(self, card_id):
+        etag = self._etags.get(card_id)
+        if etag is None:
+            body = self._json.get(card_id)
+            if body is None:
+                return None
+            etag = self._etags[card_id] = hashlib.blake2b(body, digest_size=8).hexdigest()
+        return etag
+
+    def grid_json_gzip(self, card_id):
+        """Gzipped grid_json, or None when compressing does not make it smaller."""
+        if card_id not in self._gzip:
+            body = self._json.get(card_id)
+            if body is None:
+                return None
+            packed = gzip.compress(body, 9, mtime=0)
+            self._gzip[card_id] = packed if len(packed) < len(body) else None
+        return self._gzip[card_id]
+
+    def line_masks(self, card_id):
+        masks = self._masks.get(card_id)
+        if masks is None:
+            grid = self._grids.get(card_id)
+            if grid is None:
+                return None
+            masks = self._masks[card_id] = card_line_masks(grid)
+        return masks
+
+    def as_array(self, card_ids):
+        """(N, 5, 5) uint8 NumPy array of the given cards (FREE as FREE_CELL)."""
+        if self._array is None:
+            self._array = np.frombuffer(self.cells, dtype=np.uint8).reshape(-1, 5, 5)
+        return self._array[[self._slots[card_id] for card_id in card_ids]]
+
+    def cell_values(self, card_id):
+        """The card's 25 cells as small ints (FREE_CELL for the free space)."""
+        slot = self._slots.get(card_id)
+        if slot is None:
+            return None
+        return self.cells[slot * 25:slot * 25 + 25]
+
+_catalogue = None
+_catalogue_stale = False
+
+@register_cache
+def _mark_catalogue_stale():
+    # Cards are only ever appended, so after another process's commit a
+    # cheap COUNT/MAX check decides whether the catalogue must be reloaded.
+    global _catalogue_stale
+    _catalogue_stale = True
+
+@register_change_handler("cards")
+def _on_cards_added(log_id, room_id, key, value, own):
+    if not own:
+        _mark_catalogue_stale()
+        _reset_availability()
+
+def load_card_catalogue():
+    global _catalogue, _catalogue_stale
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT numbers FROM cardboards WHERE id = ?", (card_id,))
-    row = c.fetchone()
+    c.execute("SELECT id, numbers FROM cardboards ORDER BY id")
+    _catalogue = CardCatalogue((card_id, json.loads(numbers)) for card_id, numbers in c.fetchall())
+    _catalogue_stale = False
     conn.close()
-    return json.loads(row[0]) if row else None
+    return _catalogue
+
+def get_card_catalogue():
+    global _catalogue_stale
+    if _catalogue is None:
+        return load_card_catalogue()
+    if _catalogue_stale:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*), MAX(id) FROM cardboards")
+        count, max_id = c.fetchone()
+        conn.close()
+        if (count, max_id) != (len(_catalogue), _catalogue.ids[-1] if _catalogue.ids else None):
+            return load_card_catalogue()
+        _catalogue_stale = False
+    return _catalogue
+
+def add_cardboards(cards):
+    """Append cards (lists of 25 numbers, "FREE" in the middle); returns their ids."""
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM cardboards")
+        first_id = c.fetchone()[0] + 1
+        ids = list(range(first_id, first_id + len(cards)))
+        c.executemany("INSERT INTO cardboards (id, numbers) VALUES (?, ?)",
+                      zip(ids, (json.dumps(numbers) for numbers in cards)))
+        log_change(c, "cards")
+    load_card_catalogue()
+    _reset_availability()
+    return ids
+
+# ========== CARD FUNCTIONS ==========
+def get_cardboard(card_id):
+    return get_card_catalogue().numbers(card_id)
 
 def get_cardboard_as_grid(card_id):
-    nums = get_cardboard(card_id)
-    if not nums:
-        return None
-    grid = []
-    for row in range(5):
-        row_start = row * 5
-        grid.append(nums[row_start:row_start + 5])
-    return grid
+    return get_card_catalogue().grid(card_id)
 
-def get_user_cards(telegram_id):
+def get_cardboard_response(card_id, gzipped=False):
+    """(body, etag, encoding) for /api/card, or None if the card does not exist.
+
+    The gzip variant is only used when asked for and actually smaller; it gets
+    its own strong ETag.  encoding is None for the plain JSON body.
+    """
+    catalogue = get_card_catalogue()
+    body = catalogue.grid_json(card_id)
+    if body is None:
+        return None
+    etag = catalogue.json_etag(card_id)
+    if gzipped:
+        packed = catalogue.grid_json_gzip(card_id)
+        if packed is not None:
+            return packed, f'"{etag}-gz"', 'gzip'
+    return body, f'"{etag}"', None
+
+def get_user_cards(telegram_id, room_id=None):
+    """Card ids the user holds in room_id (every room if None)."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''SELECT cardboard_id FROM user_cards
                  WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?)
-                 ORDER BY purchased_at''', (telegram_id,))
+                   AND (? IS NULL OR room_id = ?)
+                 ORDER BY purchased_at''', (telegram_id, room_id, room_id))
     cards = [row[0] for row in c.fetchall()]
     conn.close()
     return cards
 
-def get_all_cards_with_status():
+def get_round_recipients(room_id=DEFAULT_ROOM_ID):
+    """Telegram ids of every player currently holding a card in the room (one query)."""
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        SELECT 
-            cardboards.id,
-            cardboards.numbers,
-            user_cards.user_id IS NOT NULL as taken
-        FROM cardboards
-        LEFT JOIN user_cards ON cardboards.id = user_cards.cardboard_id
-        ORDER BY cardboards.id
-    ''')
-    rows = c.fetchall()
+    c.execute('''SELECT DISTINCT users.telegram_id FROM user_cards
+                 JOIN users ON users.id = user_cards.user_id
+                 WHERE user_cards.room_id = ?''', (room_id,))
+    recipients = [row[0] for row in c.fetchall()]
     conn.close()
-    return [{"id": row[0], "numbers": json.loads(row[1]), "taken": bool(row[2])} for row in rows]
+    return recipients
 
-# ========== GAME ROUND FUNCTIONS ==========
-def start_new_round():
+def get_all_cards_with_status(room_id=DEFAULT_ROOM_ID):
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT duration_seconds FROM game_rounds ORDER BY id DESC LIMIT 1")
-    row = c.fetchone()
-    duration = row[0] if row else DEFAULT_ROUND_DURATION
-    c.execute("INSERT INTO game_rounds (status, duration_seconds) VALUES ('active', ?)", (duration,))
-    conn.commit()
-    round_id = c.lastrowid
+    c.execute("SELECT cardboard_id FROM user_cards WHERE room_id = ?", (room_id,))
+    taken = {row[0] for row in c.fetchall()}
     conn.close()
-    return round_id
+    catalogue = get_card_catalogue()
+    return [{"id": card_id, "numbers": catalogue.numbers(card_id), "taken": card_id in taken}
+            for card_id in catalogue.ids]
+
+# ========== CARD AVAILABILITY ==========
+# Per room, one bit per catalogue slot (1 = sold), plus the id of the last
+# change_log row it includes and a bounded log of changes so clients can ask
+# for "what changed since version N".  Versions are "<room_id>-<log id>": the
+# log id is persisted, so a version stays valid when the bitset is rebuilt or
+# read by another process, and older versions are answered from change_log.
+# Sales and frees reach the bitset through change_log, also this process's own.
+class CardAvailability:
+    def __init__(self, catalogue, room_id, sold_ids, log_id):
+        self.catalogue = catalogue
+        self.room_id = room_id
+        self.log_id = log_id
+        self.floor = log_id     # oldest version self.log can answer
+        self.bits = bytearray((len(catalogue) + 7) // 8)
+        self.log = deque(maxlen=AVAILABILITY_LOG_SIZE)   # (log_id, card_id, taken)
+        self._body = None
+        self._free = None
+        self._pages = {}      # (after_id, before_id, limit) -> page, for this version
+        for card_id in sold_ids:
+            self._set(card_id, True)
+
+    @property
+    def version(self):
+        return f"{self.room_id}-{self.log_id}"
+
+    def is_taken(self, card_id):
+        slot = self.catalogue.slot(card_id)
+        return slot is not None and bool(self.bits[slot >> 3] >> (slot & 7) & 1)
+
+    def _set(self, card_id, taken):
+        slot = self.catalogue.slot(card_id)
+        if slot is None or self.is_taken(card_id) == taken:
+            return False
+        self.bits[slot >> 3] ^= 1 << (slot & 7)
+        return True
 
-def get_active_round():
+    def apply(self, log_id, card_id, taken):
+        """Apply one 'card' change_log row; rows already included are skipped."""
+        if log_id <= self.log_id:
+            return
+        self.log_id = log_id
+        if len(self.log) == self.log.maxlen:
+            self.floor = self.log[0][0]
+        self.log.append((log_id, card_id, taken))
+        self._set(card_id, taken)
+        self._body = None
+        self._free = None
+        self._pages = {}
+
+    def free_ids(self):
+        """Free card ids in ascending order (shared per version; do not modify)."""
+        if self._free is None:
+            self._free = [card_id for card_id in self.catalogue.ids if not self.is_taken(card_id)]
+        return self._free
+
+    def page(self, after_id=None, before_id=None, limit=20):
+        """(ids, has_prev, has_next): up to limit free ids after/before a card id."""
+        key = (after_id, before_id, limit)
+        page = self._pages.get(key)
+        if page is None:
+            free = self.free_ids()
+            if before_id is not None:
+                end = bisect_left(free, before_id)
+                start = max(0, end - limit)
+            else:
+                start = 0 if after_id is None else bisect_right(free, after_id)
+                end = start + limit
+            page = self._pages[key] = (free[start:end], start > 0, end < len(free))
+        return page
+
+    def body(self):
+        """Pre-serialized full response for the current version."""
+        if self._body is None:
+            self._body = json.dumps({"version": self.version, "available": self.free_ids()},
+                                    separators=(",", ":")).encode()
+        return self._body
+
+    def changes_since(self, log_id):
+        """{"taken": [...], "freed": [...]} since log_id, or None if not in self.log."""
+        if log_id < self.floor or log_id > self.log_id:
+            return None
+        return _card_changes((card_id, taken) for number, card_id, taken in self.log if number > log_id)
+
+def _card_changes(changes):
+    latest = {}
+    for card_id, taken in changes:
+        latest[card_id] = taken
+    return {"taken": [cid for cid, taken in latest.items() if taken],
+            "freed": [cid for cid, taken in latest.items() if not taken]}
+
+_availability = {}     # room_id -> CardAvailability
+_availability_lock = threading.RLock()
+
+@register_cache
+def _reset_availability():
+    with _availability_lock:
+        _availability.clear()
+
+@register_change_handler("card")
+def _on_card_changed(log_id, room_id, key, value, own):
+    with _availability_lock:
+        availability = _availability.get(room_id)
+        if availability is not None:
+            availability.apply(log_id, key, value is not None)
+
+def get_card_availability(room_id=DEFAULT_ROOM_ID):
+    sync_external_changes()
+    with _availability_lock:
+        return _card_availability(room_id)
+
+def _card_availability(room_id):
+    # Callers hold _availability_lock and have synced already: syncing here
+    # would wait for change_log handlers that wait for this lock.
+    availability = _availability.get(room_id)
+    if availability is None:
+        # Never cache what may be this connection's uncommitted writes.
+        if get_connection().in_transaction:
+            return CardAvailability(get_card_catalogue(), room_id, *_read_sold_cards(room_id))
+        with transaction():    # one snapshot for the cards and their log id
+            sold, log_id = _read_sold_cards(room_id)
+        availability = _availability[room_id] = CardAvailability(get_card_catalogue(), room_id, sold, log_id)
+    return availability
+
+def _read_sold_cards(room_id):
+    c = get_connection().cursor()
+    c.execute("SELECT cardboard_id FROM user_cards WHERE room_id = ?", (room_id,))
+    sold = [row[0] for row in c.fetchall()]
+    # Rows that end a run of deltas (and pruning, so that a version never
+    # goes backwards) start a new version too.
+    c.execute('''SELECT MAX(COALESCE((SELECT MAX(id) FROM change_log WHERE topic = 'card' AND room_id = ?), 0),
+                            COALESCE((SELECT MAX(id) FROM change_log WHERE topic IN ('cards', 'all', 'pruned')), 0))''',
+              (room_id,))
+    return sold, c.fetchone()[0]
+
+def _card_changes_from_log(room_id, since, until):
+    """Changes of the room between two log ids read from change_log, or None if pruned."""
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT id FROM game_rounds WHERE status = 'active' ORDER BY id DESC LIMIT 1")
-    row = c.fetchone()
+    c.execute('''SELECT COUNT(*) FROM change_log
+                 WHERE (topic IN ('cards', 'all') AND id > ? AND id <= ?)
+                    OR (topic = 'pruned' AND key > ?)''', (since, until, since))
+    if c.fetchone()[0]:
+        conn.close()
+        return None
+    c.execute('''SELECT key, value FROM change_log
+                 WHERE topic = 'card' AND room_id = ? AND id > ? AND id <= ? ORDER BY id''',
+              (room_id, since, until))
+    changes = _card_changes((card_id, user_id is not None) for card_id, user_id in c.fetchall())
     conn.close()
-    return row[0] if row else None
+    return changes
 
-def get_round_prize_pool(round_id=None):
-    if round_id is None:
-        round_id = get_active_round()
-        if not round_id:
-            return 0
+def _parse_card_version(version, room_id):
+    room, _, log_id = str(version).partition("-")
+    if room != str(room_id) or not log_id.isdigit():
+        return None
+    return int(log_id)
+
+def get_available_cards(room_id=DEFAULT_ROOM_ID):
+    """(version, pre-serialized {"version", "available"} body) for the room's free cards."""
+    sync_external_changes()
+    with _availability_lock:
+        availability = _card_availability(room_id)
+        return availability.version, availability.body()
+
+def get_available_cards_since(version, room_id=DEFAULT_ROOM_ID):
+    """(current version, {"taken", "freed"} since version or None if too old)."""
+    since = _parse_card_version(version, room_id)
+    sync_external_changes()
+    with _availability_lock:
+        availability = _card_availability(room_id)
+        current, log_id = availability.version, availability.log_id
+        changes = availability.changes_since(since) if since is not None else None
+    if changes is None and since is not None and since < log_id:
+        changes = _card_changes_from_log(room_id, since, log_id)
+    return current, changes
+
+def get_free_card_page(room_id=DEFAULT_ROOM_ID, after_id=None, before_id=None, limit=20):
+    """(version, free card ids, has_prev, has_next) for one page of the room's free cards.
+
+    Pages are keyed by card id (after_id/before_id), so they stay consistent
+    while cards sell, and are served from memory until the version changes.
+    """
+    sync_external_changes()
+    with _availability_lock:
+        availability = _card_availability(room_id)
+        return (availability.version,) + availability.page(after_id, before_id, limit)
+
+# ========== ROUND STATE CACHE ==========
+# The active round of each room (and any round asked for by id) is loaded once into a
+# RoundState and then kept current write-through by buy_card, call_number,
+# pause/resume, handle_winner, refund_round and reset_round, so the API and
+# the bot read it without querying game_rounds.  started_at is parsed once
+# into an epoch deadline, which time spent paused pushes back: a paused round
+# never expires, and resume_round() adds the pause to paused_seconds.
+class RoundState:
+    def __init__(self, round_id, room_id, status, is_paused, prize_pool, started_at, duration,
+                 paused_seconds, draw_order, draw_cursor, called):
+        self.id = round_id
+        self.room_id = room_id
+        self.status = status
+        self.is_paused = bool(is_paused)
+        self.prize_pool = prize_pool
+        self.started = calendar.timegm(time.strptime(started_at, '%Y-%m-%d %H:%M:%S'))
+        self.paused_seconds = paused_seconds or 0
+        self.set_duration(duration)
+        self.draw_order = bytes(draw_order) if draw_order is not None else None
+        self.draw_cursor = draw_cursor or 0
+        self.called = list(called)
+        self.bitmap = called_bitmap(self.called)
+
+    def set_duration(self, duration):
+        self.duration = duration
+        self.deadline = self.started + duration + self.paused_seconds
+
+    def resumed(self, paused_seconds):
+        self.is_paused = False
+        self.paused_seconds = paused_seconds
+        self.set_duration(self.duration)
+
+    def add_called(self, number):
+        if not self.bitmap >> number & 1:
+            self.bitmap |= 1 << number
+            self.called.append(number)
+
+    def expired(self, now=None):
+        if self.is_paused:
+            return False
+        return (time.time() if now is None else now) >= self.deadline
+
+_UNKNOWN = object()
+_round_lock = threading.RLock()
+_round_states = {}
+_active_round_ids = {}     # room_id -> active round id (None if the room has none)
+
+@register_cache
+def _reset_round_states():
+    with _round_lock:
+        _round_states.clear()
+        _active_round_ids.clear()
+
+def _load_round_state(round_id):
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT prize_pool FROM game_rounds WHERE id = ?", (round_id,))
+    c.execute('''SELECT room_id, status, is_paused, prize_pool, started_at, duration_seconds,
+                        paused_seconds, draw_order, draw_cursor
+                 FROM game_rounds WHERE id = ?''', (round_id,))
     row = c.fetchone()
+    if not row:
+        conn.close()
+        return None
+    c.execute("SELECT number FROM called_numbers WHERE round_id = ? ORDER BY id", (round_id,))
+    called = [r[0] for r in c.fetchall()]
     conn.close()
-    return row[0] if row else 0
+    return RoundState(round_id, *row, called)
+
+def get_round_state(round_id=None, room_id=DEFAULT_ROOM_ID):
+    """Cached RoundState for round_id (default: the room's active round), or None."""
+    sync_external_changes()
+    with _round_lock:
+        if round_id is None:
+            round_id = _active_round_ids.get(room_id, _UNKNOWN)
+            if round_id is _UNKNOWN:
+                conn = get_connection()
+                c = conn.cursor()
+                c.execute('''SELECT id FROM game_rounds WHERE room_id = ? AND status = 'active'
+                             ORDER BY id DESC LIMIT 1''', (room_id,))
+                row = c.fetchone()
+                conn.close()
+                round_id = row[0] if row else None
+                if not conn.in_transaction:
+                    _active_round_ids[room_id] = round_id
+            if round_id is None:
+                return None
+        state = _round_states.get(round_id)
+        if state is None:
+            state = _load_round_state(round_id)
+            # Never cache what may be this connection's uncommitted writes.
+            if state is not None and not get_connection().in_transaction:
+                _round_states[round_id] = state
+        return state
+
+def _drop_round_state(round_id, room_id=None):
+    """Reload a round (and the room's active round id) on next use."""
+    with _round_lock:
+        _round_states.pop(round_id, None)
+        if room_id is not None:
+            _active_round_ids.pop(room_id, None)
+
+@register_change_handler("round")
+def _on_round_changed(log_id, room_id, key, value, own):
+    if not own:
+        _drop_round_state(key, room_id)
+
+@register_change_handler("round_start")
+def _on_round_started(log_id, room_id, key, value, own):
+    if not own:
+        _drop_round_state(key, room_id)
+        with _tracker_lock:
+            finished = [round_id for round_id, tracker in _trackers.items()
+                        if tracker.room_id == room_id and round_id < key]
+        for round_id in finished:
+            _forget_round(round_id)
+
+@register_change_handler("call")
+def _on_number_called(log_id, room_id, key, value, own):
+    if not own:
+        with _round_lock:
+            state = _round_states.get(key)
+            if state is not None:
+                state.add_called(value)
+                state.draw_cursor = max(state.draw_cursor, len(state.called))
+
+def _round_started(room_id, round_id):
+    with _round_lock:
+        _active_round_ids[room_id] = round_id
+
+def _forget_round(round_id):
+    """Drop cached state of a round that is no longer active."""
+    with _round_lock:
+        _round_states.pop(round_id, None)
+        for room_id, active_id in list(_active_round_ids.items()):
+            if active_id == round_id:
+                del _active_round_ids[room_id]
+    with _tracker_lock:
+        _trackers.pop(round_id, None)
+    _forget_claims(round_id)
+
+# ========== ROOMS ==========
+# Each room runs its own sequence of rounds with its own card price and round
+# duration (NULL = the global default) and its own set of sold cards.  Users
+# play in one room at a time, stored in users.room_id.
+_rooms = None
+_rooms_lock = threading.Lock()
+
+@register_cache
+def _reset_rooms():
+    global _rooms
+    with _rooms_lock:
+        _rooms = None
+
+@register_change_handler("room")
+def _on_room_changed(log_id, room_id, key, value, own):
+    if not own:
+        _reset_rooms()
+
+def get_rooms():
+    """{room_id: {"id", "name", "card_price", "duration"}} with defaults applied."""
+    global _rooms
+    sync_external_changes()
+    with _rooms_lock:
+        if _rooms is None:
+            conn = get_connection()
+            c = conn.cursor()
+            c.execute('''SELECT rooms.id, rooms.name, COALESCE(rooms.card_price, gs.card_price, ?),
+                                rooms.duration_seconds
+                         FROM rooms LEFT JOIN game_settings gs ON gs.id = 1
+                         ORDER BY rooms.id''', (DEFAULT_CARD_PRICE,))
+            rooms = {room_id: {"id": room_id, "name": name, "card_price": price,
+                               "duration": duration or DEFAULT_ROUND_DURATION}
+                     for room_id, name, price, duration in c.fetchall()}
+            conn.close()
+            if conn.in_transaction:
+                return rooms
+            _rooms = rooms
+        return _rooms
+
+def get_room(room_id):
+    return get_rooms().get(room_id)
+
+def _room_card_price(c, room_id):
+    c.execute('''SELECT COALESCE(rooms.card_price, gs.card_price)
+                 FROM game_settings gs LEFT JOIN rooms ON rooms.id = ?
+                 WHERE gs.id = 1''', (room_id,))
+    row = c.fetchone()
+    return row[0] if row and row[0] is not None else DEFAULT_CARD_PRICE
 
-def is_round_expired(round_id):
+def create_room(admin_telegram_id, name, card_price=None, duration_seconds=None):
+    if admin_telegram_id != ADMIN_TELEGRAM_ID:
+        return "⛔ You are not admin."
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT started_at, duration_seconds FROM game_rounds WHERE id = ?", (round_id,))
-    row = c.fetchone()
+    try:
+        c.execute("INSERT INTO rooms (name, card_price, duration_seconds) VALUES (?, ?, ?)",
+                  (name, card_price, duration_seconds))
+    except sqlite3.IntegrityError:
+        conn.close()
+        return f"Room '{name}' already exists."
+    room_id = c.lastrowid
+    conn.commit()
     conn.close()
-    if not row:
-        return True
-    started_at, duration = row
-    started = datetime.strptime(started_at, '%Y-%m-%d %H:%M:%S')
-    now = datetime.utcnow()
-    elapsed = (now - started).total_seconds()
-    return elapsed >= duration
+    _reset_rooms()
+    round_id = start_new_round(room_id)
+    return f"✅ Room {room_id} ({name}) created. Round {round_id} started."
 
-def pause_round(round_id):
+def get_user_room(telegram_id):
+    user = get_user_by_telegram_id(telegram_id)
+    return user[4] if user and user[4] is not None else DEFAULT_ROOM_ID
+
+def set_user_room(telegram_id, room_id):
+    room = get_room(room_id)
+    if not room:
+        return "Room not found."
+    user_id = get_user_id(telegram_id)
+    if not user_id:
+        return "User not found. Please register first."
     conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE game_rounds SET is_paused = 1 WHERE id = ?", (round_id,))
+    c.execute("UPDATE users SET room_id = ? WHERE id = ?", (room_id, user_id))
     conn.commit()
     conn.close()
+    _update_cached_user(user_id, room_id=room_id)
+    return f"✅ You are now playing in room {room_id} ({room['name']})."
 
-def resume_round(round_id):
+# ========== GAME ROUND FUNCTIONS ==========
+def start_new_round(room_id=DEFAULT_ROOM_ID):
     conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE game_rounds SET is_paused = 0 WHERE id = ?", (round_id,))
+    # The room's configured duration, else whatever its last round used.
+    c.execute('''SELECT COALESCE(rooms.duration_seconds,
+                                 (SELECT duration_seconds FROM game_rounds
+                                  WHERE room_id = rooms.id ORDER BY id DESC LIMIT 1), ?)
+                 FROM rooms WHERE id = ?''', (DEFAULT_ROUND_DURATION, room_id))
+    row = c.fetchone()
+    duration = row[0] if row else DEFAULT_ROUND_DURATION
+    c.execute('''INSERT INTO game_rounds (status, duration_seconds, draw_order, room_id)
+                 VALUES ('active', ?, ?, ?)''', (duration, new_draw_order(), room_id))
+    round_id = c.lastrowid
+    _bump_stats(c, total_rounds=1)
     conn.commit()
     conn.close()
+    _round_started(room_id, round_id)
+    return round_id
 
-# ========== CARD PURCHASE ==========
-def buy_card(telegram_id, cardboard_id):
+def get_active_round(room_id=DEFAULT_ROOM_ID):
+    state = get_round_state(room_id=room_id)
+    return state.id if state else None
+
+def get_round_result(round_id):
+    """{"round_id", "status", "winner"} for a round; winner is a username or None."""
     conn = get_connection()
     c = conn.cursor()
+    c.execute('''SELECT game_rounds.status, users.username
+                 FROM game_rounds LEFT JOIN users ON users.id = game_rounds.winner_user_id
+                 WHERE game_rounds.id = ?''', (round_id,))
+    row = c.fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"round_id": round_id, "status": row[0], "winner": row[1]}
 
-    user_id = get_user_id(telegram_id)
-    if not user_id:
-        conn.close()
-        return False, "User not found. Please register first."
+def get_active_rounds():
+    """States of every round still marked active, in every room (used to rebuild schedules)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id FROM game_rounds WHERE status = 'active' ORDER BY id")
+    round_ids = [row[0] for row in c.fetchall()]
+    conn.close()
+    return [state for state in map(get_round_state, round_ids) if state]
 
-    round_id = get_active_round()
-    if not round_id:
-        conn.close()
-        return False, "No active game round. Please wait for admin to start one."
+def get_round_prize_pool(round_id=None):
+    state = get_round_state(round_id)
+    return state.prize_pool if state else 0
 
-    c.execute("SELECT card_price FROM game_settings WHERE id = 1")
-    row = c.fetchone()
-    price = row[0] if row else DEFAULT_CARD_PRICE
+def is_round_expired(round_id):
+    state = get_round_state(round_id)
+    return state.expired() if state else True
 
-    c.execute("SELECT balance FROM users WHERE id = ?", (user_id,))
-    balance = c.fetchone()[0]
-    if balance < price:
-        conn.close()
-        return False, f"❌ Insufficient balance. Need {price}, you have {balance}."
+def pause_round(round_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE game_rounds SET is_paused = 1, paused_at = CURRENT_TIMESTAMP WHERE id = ? AND is_paused = 0",
+              (round_id,))
+    conn.commit()
+    conn.close()
+    state = get_round_state(round_id)
+    if state:
+        state.is_paused = True
 
-    c.execute("SELECT COUNT(*) FROM user_cards WHERE user_id = ?", (user_id,))
-    if c.fetchone()[0] >= MAX_CARDS_PER_USER:
-        conn.close()
-        return False, f"❌ Maximum {MAX_CARDS_PER_USER} cards allowed per round."
+def resume_round(round_id):
+    # The time spent paused moves the round's deadline back by as much.
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute('''UPDATE game_rounds
+                     SET is_paused = 0, paused_at = NULL,
+                         paused_seconds = COALESCE(paused_seconds, 0)
+                             + MAX(0, COALESCE(strftime('%s', 'now') - strftime('%s', paused_at), 0))
+                     WHERE id = ? AND is_paused = 1''', (round_id,))
+        c.execute("SELECT paused_seconds FROM game_rounds WHERE id = ?", (round_id,))
+        row = c.fetchone()
+    state = get_round_state(round_id)
+    if state and row:
+        state.resumed(row[0] or 0)
 
-    try:
-        c.execute("UPDATE users SET balance = balance - ? WHERE id = ?", (price, user_id))
+# ========== CARD PURCHASE ==========
+# A purchase is one short BEGIN IMMEDIATE transaction: the write lock is taken
+# up front, and each card is a savepoint whose insert only succeeds while the
+# user is under MAX_CARDS_PER_USER and whose debit only succeeds while the
+# balance covers the price, so concurrent buyers cannot oversell or overdraw.
+class _PurchaseRejected(Exception):
+    pass
+
+def _buy_one_card(c, user_id, room_id, round_id, cardboard_id, price):
+    with transaction():
+        c.execute('''INSERT INTO user_cards (user_id, cardboard_id, room_id)
+                     SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM user_cards
+                                           WHERE room_id = ? AND user_id = ?) < ?''',
+                  (user_id, cardboard_id, room_id, room_id, user_id, MAX_CARDS_PER_USER))
+        if c.rowcount == 0:
+            raise _PurchaseRejected(f"❌ Maximum {MAX_CARDS_PER_USER} cards allowed per round.")
+        c.execute("UPDATE users SET balance = balance - ? WHERE id = ? AND balance >= ?",
+                  (price, user_id, price))
+        if c.rowcount == 0:
+            c.execute("SELECT balance FROM users WHERE id = ?", (user_id,))
+            balance = c.fetchone()[0]
+            raise _PurchaseRejected(f"❌ Insufficient balance. Need {price}, you have {balance}.")
+        _record_balance_change(c, user_id, -price, 'card_purchase', f"{round_id}:{cardboard_id}")
         c.execute("UPDATE game_rounds SET prize_pool = prize_pool + ? WHERE id = ?", (price, round_id))
-        c.execute("INSERT INTO user_cards (user_id, cardboard_id) VALUES (?, ?)", (user_id, cardboard_id))
         c.execute('''
-            INSERT INTO card_purchase_history (round_id, user_id, cardboard_id, purchased_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (round_id, user_id, cardboard_id))
-        conn.commit()
-        conn.close()
-        return True, f"✅ Card purchased! New balance: {balance - price}"
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        conn.close()
-        return False, "❌ This card is already taken by another user."
+            INSERT INTO card_purchase_history (round_id, user_id, cardboard_id, purchased_at, price)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+        ''', (round_id, user_id, cardboard_id, price))
+        c.execute("SELECT balance FROM users WHERE id = ?", (user_id,))
+        return c.fetchone()[0]
+
+def buy_cards(telegram_id, cardboard_ids, room_id=DEFAULT_ROOM_ID):
+    """Buy several cards for the room's active round in one transaction.
+
+    Returns one {"card_id", "success", "message"} dict per requested card, in
+    request order; cards past the per-user limit or the balance are rejected
+    individually while the others still go through.
+    """
+    cardboard_ids = list(dict.fromkeys(cardboard_ids))
+    sync_external_changes()     # picks up cards appended by another process
+    catalogue = get_card_catalogue()
+    results = {}
+    sold = []
+
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = c.fetchone()
+        if not row:
+            return [{"card_id": cid, "success": False, "message": "User not found. Please register first."}
+                    for cid in cardboard_ids]
+        user_id = row[0]
+
+        c.execute('''SELECT id FROM game_rounds WHERE room_id = ? AND status = 'active'
+                     ORDER BY id DESC LIMIT 1''', (room_id,))
+        row = c.fetchone()
+        if not row:
+            return [{"card_id": cid, "success": False,
+                     "message": "No active game round. Please wait for admin to start one."}
+                    for cid in cardboard_ids]
+        round_id = row[0]
+        price = _room_card_price(c, room_id)
+
+        for cardboard_id in cardboard_ids:
+            if cardboard_id not in catalogue:
+                results[cardboard_id] = (False, "❌ Card not found.")
+                continue
+            try:
+                balance = _buy_one_card(c, user_id, room_id, round_id, cardboard_id, price)
+            except sqlite3.IntegrityError:
+                results[cardboard_id] = (False, "❌ This card is already taken by another user.")
+            except _PurchaseRejected as e:
+                results[cardboard_id] = (False, str(e))
+            else:
+                results[cardboard_id] = (True, f"✅ Card purchased! New balance: {balance}")
+                sold.append(cardboard_id)
+                new_balance = balance
+
+        c.execute("SELECT prize_pool FROM game_rounds WHERE id = ?", (round_id,))
+        prize_pool = c.fetchone()[0]
+
+    if sold:
+        _balances_changed({user_id: new_balance})
+        state = get_round_state(round_id)
+        if state:
+            state.prize_pool = prize_pool
+        for cardboard_id in sold:
+            _track_card_sold(room_id, cardboard_id, user_id)
+    return [{"card_id": cid, "success": results[cid][0], "message": results[cid][1]}
+            for cid in cardboard_ids]
+
+def buy_card(telegram_id, cardboard_id, room_id=DEFAULT_ROOM_ID):
+    result = buy_cards(telegram_id, [cardboard_id], room_id)[0]
+    return result["success"], result["message"]
 
 # ========== CALLED NUMBERS ==========
-def call_number(round_id=None):
+# Each round gets its whole draw order up front: a permutation of 1..75 from
+# the OS CSPRNG, stored as 75 bytes in game_rounds.draw_order with
+# draw_cursor pointing at the next number.  Drawing is a cursor advance, and
+# the full order can be audited once the round is over.
+_draw_rng = random.SystemRandom()
+
+def new_draw_order(already_called=()):
+    """75-byte draw order; numbers already called (legacy rounds) come first."""
+    rest = [n for n in range(1, 76) if n not in set(already_called)]
+    _draw_rng.shuffle(rest)
+    return bytes(list(already_called) + rest)
+
+def call_number(round_id=None, room_id=DEFAULT_ROOM_ID):
     if round_id is None:
-        round_id = get_active_round()
+        round_id = get_active_round(room_id)
         if not round_id:
             return None
 
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute("SELECT is_paused, status FROM game_rounds WHERE id = ?", (round_id,))
-    row = c.fetchone()
-    if not row or row[1] != 'active' or row[0] == 1:
-        conn.close()
+    state = get_round_state(round_id)
+    if not state or state.status != 'active' or state.is_paused:
         return None
-
-    c.execute("SELECT number FROM called_numbers WHERE round_id = ?", (round_id,))
-    used = {row[0] for row in c.fetchall()}
-
-    available = [n for n in range(1, 76) if n not in used]
-    if not available:
-        conn.close()
+    if state.draw_cursor >= 75:
         return None
 
-    number = random.choice(available)
-    c.execute("INSERT INTO called_numbers (round_id, number) VALUES (?, ?)", (round_id, number))
-    conn.commit()
-    conn.close()
+    draw_order = state.draw_order
+    cursor = state.draw_cursor
+    with transaction() as conn:
+        c = conn.cursor()
+        if draw_order is None:
+            # Round started before draw orders existed: fix the remaining order now.
+            draw_order = new_draw_order(state.called)
+            cursor = len(state.called)
+            c.execute("UPDATE game_rounds SET draw_order = ?, draw_cursor = ? WHERE id = ? AND draw_order IS NULL",
+                      (draw_order, cursor, round_id))
+            if c.rowcount == 0:
+                conn.rollback()
+                _drop_round_state(round_id)
+                return None
+        number = draw_order[cursor]
+        # Compare-and-set on the cursor, so two processes can never draw the same slot.
+        c.execute("UPDATE game_rounds SET draw_cursor = ? WHERE id = ? AND draw_cursor = ?",
+                  (cursor + 1, round_id, cursor))
+        if c.rowcount == 0:
+            conn.rollback()
+            _drop_round_state(round_id)
+            return None
+        c.execute("INSERT INTO called_numbers (round_id, number, room_id) VALUES (?, ?, ?)",
+                  (round_id, number, state.room_id))
+
+    state.draw_order = draw_order
+    state.draw_cursor = cursor + 1
+    state.add_called(number)
+    _track_number_called(round_id, number)
     return number
 
-def get_called_numbers(round_id=None):
-    if round_id is None:
-        round_id = get_active_round()
-        if not round_id:
-            return []
+def get_draw_order(round_id):
+    """Full draw order of a finished round (None while it is still active)."""
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT number FROM called_numbers WHERE round_id = ? ORDER BY called_at", (round_id,))
-    nums = [row[0] for row in c.fetchall()]
+    c.execute("SELECT status, draw_order, draw_cursor FROM game_rounds WHERE id = ?", (round_id,))
+    row = c.fetchone()
     conn.close()
-    return nums
+    if not row or row[0] == 'active' or row[1] is None:
+        return None
+    return {"draw_order": list(row[1]), "drawn": row[2]}
+
+def get_called_numbers(round_id=None, room_id=DEFAULT_ROOM_ID):
+    state = get_round_state(round_id, room_id)
+    return list(state.called) if state else []
 
 # ========== WINNER DETECTION ==========
-def check_card_winner(card, called_numbers):
-    called = set(called_numbers)
-    for row in card:
-        if all(cell == "FREE" or cell in called for cell in row):
-            return True
-    for col in range(5):
-        if all(card[row][col] == "FREE" or card[row][col] in called for row in range(5)):
+# Called numbers are held as one integer bitmap (bit n set = n was called) and
+# every card is compiled once into 10 line masks (5 rows, then 5 columns) with
+# the FREE cell left out, i.e. always marked.  A line is complete when
+# mask & called == mask.
+def called_bitmap(called_numbers):
+    bitmap = 0
+    for number in called_numbers:
+        bitmap |= 1 << number
+    return bitmap
+
+def card_line_masks(card):
+    rows = [0] * 5
+    cols = [0] * 5
+    for r in range(5):
+        for col in range(5):
+            cell = card[r][col]
+            if cell != "FREE" and cell != FREE_CELL:
+                bit = 1 << cell
+                rows[r] |= bit
+                cols[col] |= bit
+    return tuple(rows + cols)
+
+_cached_line_masks = lru_cache(maxsize=4096)(card_line_masks)
+
+def masks_win(masks, bitmap):
+    for mask in masks:
+        if mask & bitmap == mask:
             return True
     return False
 
-def find_winners(round_id=None):
-    if round_id is None:
-        round_id = get_active_round()
-        if not round_id:
-            return []
+def check_card_winner(card, called_numbers):
+    """True if any row or column of the 5x5 card is fully called.
 
+    called_numbers may be a list of numbers or a bitmap from called_bitmap().
+    """
+    bitmap = called_numbers if isinstance(called_numbers, int) else called_bitmap(called_numbers)
+    try:
+        masks = _cached_line_masks(card)
+    except TypeError:   # list-based grid, not hashable
+        masks = card_line_masks(card)
+    return masks_win(masks, bitmap)
+
+# ========== INCREMENTAL WINNER TRACKING ==========
+# Per round, an inverted index maps every still-uncalled number to the
+# (card, line) pairs of the cards sold in its room that contain it, and each card keeps a
+# counter of uncalled cells per line.  call_number() only walks the index entry
+# of the number just drawn, so winners are known the moment they complete.
+class WinnerTracker:
+    def __init__(self, round_id, room_id, called=()):
+        self.round_id = round_id
+        self.room_id = room_id
+        self.bitmap = called_bitmap(called)
+        self.index = {}       # number -> [(card_id, line), ...]
+        self.remaining = {}   # card_id -> uncalled cells left in each of its 10 lines
+        self.owners = {}      # card_id -> user_id
+        self.winners = {}     # card_id -> user_id, in completion order
+
+    def add_card(self, card_id, user_id):
+        if card_id in self.owners:
+            return
+        masks = get_card_catalogue().line_masks(card_id)
+        if masks is None:
+            return
+        self.owners[card_id] = user_id
+        remaining = []
+        for line, mask in enumerate(masks):
+            open_bits = mask & ~self.bitmap
+            remaining.append(bin(open_bits).count("1"))
+            while open_bits:
+                low_bit = open_bits & -open_bits
+                self.index.setdefault(low_bit.bit_length() - 1, []).append((card_id, line))
+                open_bits ^= low_bit
+        self.remaining[card_id] = remaining
+        if 0 in remaining:
+            self.winners[card_id] = user_id
+
+    def remove_card(self, card_id):
+        # Index entries are left behind and skipped when their number is called.
+        self.owners.pop(card_id, None)
+        self.remaining.pop(card_id, None)
+        self.winners.pop(card_id, None)
+
+    def call(self, number):
+        """Mark a number as called and return the cards it completed."""
+        bit = 1 << number
+        if self.bitmap & bit:
+            return []
+        self.bitmap |= bit
+        completed = []
+        for card_id, line in self.index.pop(number, ()):
+            remaining = self.remaining.get(card_id)
+            if remaining is None:
+                continue
+            remaining[line] -= 1
+            if remaining[line] == 0 and card_id not in self.winners:
+                self.winners[card_id] = self.owners[card_id]
+                completed.append(card_id)
+        return completed
+
+_trackers = {}
+_tracker_lock = threading.RLock()
+
+@register_cache
+def _reset_winner_trackers():
+    with _tracker_lock:
+        _trackers.clear()
+
+def _build_winner_tracker(round_id):
     conn = get_connection()
     c = conn.cursor()
-
-    called = get_called_numbers(round_id)
-    if not called:
-        conn.close()
-        return []
-
-    c.execute('SELECT user_id, cardboard_id FROM user_cards')
-    winners = []
+    c.execute("SELECT room_id FROM game_rounds WHERE id = ?", (round_id,))
+    row = c.fetchone()
+    room_id = row[0] if row else DEFAULT_ROOM_ID
+    c.execute("SELECT number FROM called_numbers WHERE round_id = ?", (round_id,))
+    tracker = WinnerTracker(round_id, room_id, [row[0] for row in c.fetchall()])
+    c.execute("SELECT user_id, cardboard_id FROM user_cards WHERE room_id = ? ORDER BY id", (room_id,))
     for user_id, cardboard_id in c.fetchall():
-        card_data = get_cardboard(cardboard_id)
-        if not card_data:
-            continue
-        card_grid = [card_data[i*5:(i+1)*5] for i in range(5)]
-        if check_card_winner(card_grid, called):
-            winners.append(user_id)
-
+        tracker.add_card(cardboard_id, user_id)
     conn.close()
-    return winners
-
-# ========== PRIZE DISTRIBUTION ==========
-def handle_winner(winner_user_id, round_id=None):
+    return tracker
+
+def get_winner_tracker(round_id):
+    sync_external_changes()
+    with _tracker_lock:
+        tracker = _trackers.get(round_id)
+        if tracker is None:
+            tracker = _build_winner_tracker(round_id)
+            if not get_connection().in_transaction:
+                _trackers[round_id] = tracker
+        return tracker
+
+@register_change_handler("card")
+def _on_card_sold_or_freed(log_id, room_id, key, value, own):
+    if not own:
+        with _tracker_lock:
+            for tracker in _trackers.values():
+                if tracker.room_id == room_id:
+                    if value is None:
+                        tracker.remove_card(key)
+                    else:
+                        tracker.add_card(key, value)
+
+@register_change_handler("call")
+def _on_number_called_track(log_id, room_id, key, value, own):
+    if not own:
+        with _tracker_lock:
+            tracker = _trackers.get(key)
+            if tracker is not None:
+                tracker.call(value)
+
+def _track_card_sold(room_id, cardboard_id, user_id):
+    with _tracker_lock:
+        for tracker in _trackers.values():
+            if tracker.room_id == room_id:
+                tracker.add_card(cardboard_id, user_id)
+
+def _track_number_called(round_id, number):
+    tracker = get_winner_tracker(round_id)
+    with _tracker_lock:
+        return tracker.call(number)
+
+def get_winning_cards(round_id=None, room_id=DEFAULT_ROOM_ID):
+    """{cardboard_id: user_id} for every sold card with a complete line."""
+    if round_id is None:
+        round_id = get_active_round(room_id)
+        if not round_id:
+            return {}
+    tracker = get_winner_tracker(round_id)
+    with _tracker_lock:
+        return dict(tracker.winners)
+
+# ----- Batched evaluation of every sold card -----
+def _evaluate_sold_cards(round_id):
+    """Return [(cardboard_id, user_id, cells_missing)] for every sold card.
+
+    cells_missing is the number of uncalled cells in the card's best row or
+    column (0 = bingo).  With NumPy the cards are scored in one vectorized
+    pass over an (N, 5, 5) array and a boolean called-number lookup table.
+    """
+    state = get_round_state(round_id)
+    if not state:
+        return []
     conn = get_connection()
     c = conn.cursor()
+    c.execute("SELECT cardboard_id, user_id FROM user_cards WHERE room_id = ? ORDER BY id", (state.room_id,))
+    catalogue = get_card_catalogue()
+    sold = [(card_id, user_id) for card_id, user_id in c.fetchall() if card_id in catalogue]
+    conn.close()
+    if not sold:
+        return []
+    called = state.called
+
+    if np is not None:
+        lookup = np.zeros(76, dtype=bool)
+        lookup[FREE_CELL] = True
+        lookup[called] = True
+        marked = lookup[catalogue.as_array([card_id for card_id, _ in sold])]
+        row_missing = 5 - marked.sum(axis=2).max(axis=1)
+        col_missing = 5 - marked.sum(axis=1).max(axis=1)
+        missing = np.minimum(row_missing, col_missing).tolist()
+    else:
+        bitmap = called_bitmap(called)
+        missing = [min(bin(mask & ~bitmap).count("1") for mask in catalogue.line_masks(card_id))
+                   for card_id, _ in sold]
+    return [(card_id, user_id, left) for (card_id, user_id), left in zip(sold, missing)]
+
+def find_winners(round_id=None, batched=False, room_id=DEFAULT_ROOM_ID):
+    if not batched:
+        return list(get_winning_cards(round_id, room_id).values())
+    if round_id is None:
+        round_id = get_active_round(room_id)
+        if not round_id:
+            return []
+    return [user_id for _, user_id, left in _evaluate_sold_cards(round_id) if left == 0]
 
+def closest_to_bingo(round_id=None, limit=10, room_id=DEFAULT_ROOM_ID):
+    """Sold cards ordered by how few cells they still need, best first."""
     if round_id is None:
-        round_id = get_active_round()
+        round_id = get_active_round(room_id)
         if not round_id:
-            conn.close()
-            return "No active round."
+            return []
+    ranked = sorted(_evaluate_sold_cards(round_id), key=lambda entry: entry[2])
+    return ranked[:limit]
+
+# ========== PRIZE DISTRIBUTION ==========
+def handle_winner(winner_user_id, round_id=None, room_id=DEFAULT_ROOM_ID):
+    state = get_round_state(round_id, room_id)
+    if round_id is None and not state:
+        return "No active round."
+    if not state or state.status != 'active':
+        return "Round already finished or being processed."
+    round_id = state.id
+
+    conn = get_connection()
+    c = conn.cursor()
 
     c.execute("UPDATE game_rounds SET status = 'processing' WHERE id = ? AND status = 'active'", (round_id,))
     if c.rowcount == 0:
         conn.close()
         return "Round already finished or being processed."
 
-    c.execute("SELECT prize_pool, started_at, duration_seconds FROM game_rounds WHERE id = ?", (round_id,))
+    c.execute("SELECT prize_pool FROM game_rounds WHERE id = ?", (round_id,))
     row = c.fetchone()
     if not row:
         conn.rollback()
         conn.close()
         return "Round not found."
-    prize_pool, started_at, duration = row
+    prize_pool = row[0]
 
-    started = datetime.strptime(started_at, '%Y-%m-%d %H:%M:%S')
-    if (datetime.utcnow() - started).total_seconds() > duration:
+    if state.expired():
         conn.rollback()
         conn.close()
         return refund_round(round_id)
@@ -517,69 +1974,249 @@ def handle_winner(winner_user_id, round_id=None):
     winner_amount = prize_pool - house_cut
 
     c.execute("UPDATE users SET balance = balance + ? WHERE id = ?", (winner_amount, winner_user_id))
+    _record_balance_change(c, winner_user_id, winner_amount, 'prize', round_id)
+    c.execute("SELECT balance FROM users WHERE id = ?", (winner_user_id,))
+    winner_balance = c.fetchone()[0]
     c.execute("INSERT INTO house_earnings (source, amount) VALUES ('bingo_round', ?)", (house_cut,))
-    c.execute('''UPDATE game_rounds SET status = 'finished', ended_at = CURRENT_TIMESTAMP
-                 WHERE id = ?''', (round_id,))
+    _bump_stats(c, total_house_earnings=house_cut)
+    c.execute('''UPDATE game_rounds SET status = 'finished', ended_at = CURRENT_TIMESTAMP,
+                 winner_user_id = ? WHERE id = ?''', (winner_user_id, round_id))
 
     conn.commit()
     conn.close()
+    _balances_changed({winner_user_id: winner_balance})
+    _forget_round(round_id)
 
-    new_round_id = start_new_round()
+    new_round_id = start_new_round(state.room_id)
     return f"🏆 Winner paid {winner_amount} ETB. House earned {house_cut} ETB. New round {new_round_id} started."
 
 def refund_round(round_id):
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute('''
-        SELECT user_id, SUM(price) FROM (
-            SELECT uc.user_id, gs.card_price as price
-            FROM user_cards uc
-            JOIN game_settings gs ON 1=1
-            WHERE uc.cardboard_id IN (
-                SELECT cardboard_id FROM card_purchase_history WHERE round_id = ?
-            )
-        ) GROUP BY user_id
-    ''', (round_id,))
-    refunds = c.fetchall()
-
-    if not refunds:
-        c.execute("UPDATE game_rounds SET status = 'finished', ended_at = CURRENT_TIMESTAMP WHERE id = ?", (round_id,))
-        conn.commit()
-        conn.close()
-        start_new_round()
+    """Give every player of the round back what they paid for its cards.
+
+    All refunds are one grouped UPDATE over card_purchase_history (which records
+    the price of each purchase), plus one ledger entry per player, in a single
+    transaction.  Purchases from before prices were recorded fall back to the
+    room's current card price.
+    """
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT room_id FROM game_rounds WHERE id = ? AND status = 'active'", (round_id,))
+        row = c.fetchone()
+        if not row:
+            return "Round already finished or being processed."
+        room_id = row[0]
+        mark = _ledger_mark(c)
+        refunds = '''SELECT user_id, SUM(COALESCE(price, ?)) AS total
+                       FROM card_purchase_history WHERE round_id = ? GROUP BY user_id'''
+        params = (_room_card_price(c, room_id), round_id)
+
+        c.execute(f'''UPDATE users SET balance = balance + refunds.total
+                      FROM ({refunds}) AS refunds
+                      WHERE users.id = refunds.user_id''', params)
+        refunded = c.rowcount
+        c.execute(f'''INSERT INTO balance_ledger (user_id, delta, balance_after, reason, ref)
+                      SELECT users.id, refunds.total, users.balance, 'refund', ?
+                      FROM ({refunds}) AS refunds JOIN users ON users.id = refunds.user_id''',
+                  (str(round_id),) + params)
+        c.execute('''UPDATE game_rounds SET status = ?, ended_at = CURRENT_TIMESTAMP
+                     WHERE id = ?''', ('refunded' if refunded else 'finished', round_id))
+        balances = _ledger_balances_since(c, mark)
+    _balances_changed(balances)
+    _forget_round(round_id)
+
+    new_round_id = start_new_round(room_id)
+    if not refunded:
         return "Round closed (no players)."
-
-    for user_id, total_paid in refunds:
-        c.execute("UPDATE users SET balance = balance + ? WHERE id = ?", (total_paid, user_id))
-
-    c.execute('''UPDATE game_rounds SET status = 'refunded', ended_at = CURRENT_TIMESTAMP
-                 WHERE id = ?''', (round_id,))
-
-    conn.commit()
-    conn.close()
-
-    new_round_id = start_new_round()
     return f"All players refunded. New round {new_round_id} started."
 
-def check_round_timeout():
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute("SELECT id FROM game_rounds WHERE status = 'active' ORDER BY id DESC LIMIT 1")
-    row = c.fetchone()
-    if not row:
-        conn.close()
+def check_round_timeout(round_id=None, room_id=DEFAULT_ROOM_ID):
+    state = get_round_state(round_id, room_id)
+    if state and state.status == 'active' and state.expired():
+        return refund_round(state.id)
+
+# ========== WIN CLAIMS ==========
+# Players tend to tap "I Won!" many times at once.  claim_win() answers the
+# common case (not a winner yet) from a verdict cached per (round, card) and
+# number of calls so far.  Concurrent claims for one card share a single
+# _Claim, and every round's claims are queued and settled by one thread at a
+# time, CLAIM_WINDOW_SECONDS after the first of them arrived: valid claims are
+# ordered by when their card completed a line (then by purchase order), the
+# first is paid through handle_winner and the rest are told the round is won,
+# instead of all racing on the game_rounds update.
+class _Claim:
+    def __init__(self, round_id, user_id, card_id):
+        self.round_id = round_id
+        self.user_id = user_id
+        self.card_id = card_id
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+
+_claim_lock = threading.Lock()
+_claim_queues = {}       # round_id -> [_Claim] waiting to be settled
+_claims_in_flight = {}   # (round_id, card_id) -> _Claim
+_settle_locks = {}       # round_id -> Lock held by the thread settling its claims
+_verdicts = {}           # (round_id, card_id) -> (called count, is winner)
+
+@register_cache
+def _reset_verdicts():
+    with _claim_lock:
+        _verdicts.clear()
+
+def _forget_claims(round_id):
+    with _claim_lock:
+        for key in [key for key in _verdicts if key[0] == round_id]:
+            del _verdicts[key]
+        _settle_locks.pop(round_id, None)
+
+def card_is_winner(round_id, cardboard_id):
+    """True if the sold card has a complete line in the round (memoized per call count)."""
+    state = get_round_state(round_id)
+    if not state:
+        return False
+    key = (round_id, cardboard_id)
+    called = len(state.called)
+    with _claim_lock:
+        cached = _verdicts.get(key)
+    if cached and cached[0] == called:
+        return cached[1]
+    tracker = get_winner_tracker(round_id)
+    with _tracker_lock:
+        verdict = cardboard_id in tracker.winners
+    with _claim_lock:
+        _verdicts[key] = (called, verdict)
+    return verdict
+
+def _settle_claims(round_id):
+    with _claim_lock:
+        queue = _claim_queues.get(round_id)
+        first = queue[0].queued_at if queue else None
+    if first is not None:
+        delay = CLAIM_WINDOW_SECONDS - (time.monotonic() - first)
+        if delay > 0:
+            time.sleep(delay)   # let the other simultaneous winners queue up
+    with _claim_lock:
+        claims = _claim_queues.pop(round_id, [])
+    if not claims:
         return
-
-    round_id = row[0]
-    if is_round_expired(round_id):
-        c.execute("SELECT status FROM game_rounds WHERE id = ?", (round_id,))
-        status = c.fetchone()[0]
-        if status == 'active':
-            conn.close()
-            return refund_round(round_id)
-    conn.close()
+    # Every popped claim must be answered and released, even if paying fails,
+    # or its waiters (and later claims for the same card) would hang.
+    try:
+        _rank_and_pay(round_id, claims)
+    except Exception as e:
+        print(f"⚠️ Settling win claims for round {round_id} failed: {e}")
+        for claim in claims:
+            if claim.result is None:
+                claim.result = (False, "Could not check your claim, please try again.")
+    finally:
+        with _claim_lock:
+            for claim in claims:
+                _claims_in_flight.pop((round_id, claim.card_id), None)
+        for claim in claims:
+            claim.done.set()
+
+def _rank_and_pay(round_id, claims):
+    state = get_round_state(round_id)
+    tracker = get_winner_tracker(round_id)
+    with _tracker_lock:
+        rank = {card_id: position for position, card_id in enumerate(tracker.winners)}
+    valid = sorted((claim for claim in claims if claim.card_id in rank), key=lambda claim: rank[claim.card_id])
+    winner = valid[0] if valid and state and state.status == 'active' else None
+    if winner:
+        message = handle_winner(winner.user_id, round_id)
+        winner.result = (message.startswith("🏆"), message)
+    for claim in claims:
+        if claim is winner:
+            pass
+        elif claim.card_id not in rank:
+            claim.result = (False, "Not a winning card yet.")
+        elif winner:
+            claim.result = (False, f"Round {round_id} was already won with card {winner.card_id}.")
+        else:
+            claim.result = (False, "Round already finished or being processed.")
+
+def claim_win(telegram_id, cardboard_id, room_id=DEFAULT_ROOM_ID):
+    """Verify and pay a bingo claim; returns (paid, message)."""
+    user = get_user_by_telegram_id(telegram_id)
+    if not user:
+        return False, "User not found. Please register first."
+    try:
+        cardboard_id = int(cardboard_id)
+    except (TypeError, ValueError):
+        return False, "Invalid card."
+    state = get_round_state(room_id=room_id)
+    if not state or state.status != 'active':
+        return False, "No active round."
+    round_id = state.id
+
+    tracker = get_winner_tracker(round_id)
+    with _tracker_lock:
+        owner = tracker.owners.get(cardboard_id)
+    if owner != user[0]:
+        return False, "You don't own this card."
+    if not card_is_winner(round_id, cardboard_id):
+        return False, "Not a winning card yet."
+
+    with _claim_lock:
+        claim = _claims_in_flight.get((round_id, cardboard_id))
+        if claim is None:
+            claim = _claims_in_flight[(round_id, cardboard_id)] = _Claim(round_id, user[0], cardboard_id)
+            _claim_queues.setdefault(round_id, []).append(claim)
+        settle_lock = _settle_locks.setdefault(round_id, threading.Lock())
+    # Whoever holds the round's lock settles everything queued so far; a
+    # claim settled meanwhile by another thread is already done.
+    if not settle_lock.acquire(timeout=CLAIM_WAIT_SECONDS):
+        return False, "Your claim is still being checked, please try again."
+    try:
+        if not claim.done.is_set():
+            _settle_claims(round_id)
+    finally:
+        settle_lock.release()
+    if not claim.done.wait(CLAIM_WAIT_SECONDS):
+        return False, "Your claim is still being checked, please try again."
+    return claim.result
+
+# ========== CARD VIEWER STATE ==========
+# Everything the card page shows for one card in the room's active round,
+# read from the cached RoundState.  Called numbers only ever grow within a
+# round, so the count called so far is the sequence number: a client that
+# has seen `since` numbers of the same round only gets the ones after it.
+# "marked" is a 25-bit mask of the card's cells (row-major, bit 0 = top left)
+# that are called or FREE.
+def card_marked_mask(card_id, bitmap):
+    cells = get_card_catalogue().cell_values(card_id)
+    if cells is None:
+        return None
+    marked = 0
+    for i, number in enumerate(cells):
+        if number == FREE_CELL or bitmap >> number & 1:
+            marked |= 1 << i
+    return marked
+
+def get_card_state(card_id, room_id=DEFAULT_ROOM_ID, round_id=None, since=None):
+    """Viewer state of a card, or only what changed since (round_id, since); None if no such card."""
+    catalogue = get_card_catalogue()
+    if card_id not in catalogue:
+        return None
+    state = get_round_state(room_id=room_id)
+    if not state:
+        return {"card_id": card_id, "room_id": room_id, "round_id": None, "status": None,
+                "paused": False, "seq": 0, "grid": catalogue.grid(card_id), "called": [],
+                "marked": card_marked_mask(card_id, 0), "bingo": False}
+
+    called = list(state.called)    # one snapshot, so seq, called and marked agree
+    seq = len(called)
+    result = {"card_id": card_id, "room_id": room_id, "round_id": state.id,
+              "status": state.status, "paused": state.is_paused, "seq": seq}
+    if since is not None and round_id == state.id and 0 <= since <= seq:
+        result["since"] = since
+        result["called"] = called[since:]
+    else:
+        result["grid"] = catalogue.grid(card_id)
+        result["called"] = called
+    result["marked"] = card_marked_mask(card_id, called_bitmap(called))
+    result["bingo"] = card_is_winner(state.id, card_id)
+    return result
 
 # ========== DEPOSITS (Payments) ==========
 def request_deposit(telegram_id, amount, transaction_ref):
@@ -621,10 +2258,15 @@ def approve_deposit(admin_id, payment_id):
     c.execute("UPDATE payments SET status = 'approved', approved_by = ?, approved_at = CURRENT_TIMESTAMP WHERE payment_id = ?",
               (admin_id, payment_id))
     c.execute("UPDATE users SET balance = balance + ? + ? WHERE id = ?", (amount, DEPOSIT_BONUS, user_id))
+    _record_balance_change(c, user_id, amount + DEPOSIT_BONUS, 'deposit', payment_id)
     c.execute("UPDATE users SET total_deposited = total_deposited + ? WHERE id = ?", (amount, user_id))
+    c.execute("SELECT balance FROM users WHERE id = ?", (user_id,))
+    new_balance = c.fetchone()[0]
+    _bump_stats(c, total_deposits=amount)
 
     conn.commit()
     conn.close()
+    _balances_changed({user_id: new_balance})
     return "✅ Deposit approved and balance updated."
 
 def reject_deposit(admin_id, payment_id):
@@ -638,31 +2280,59 @@ def reject_deposit(admin_id, payment_id):
     conn.close()
     return "❌ Deposit rejected."
 
-def get_pending_deposits():
+# ----- Pending queues -----
+# Keyset pages over the (status, id) index, oldest first.  after_id pages
+# forward, before_id pages back; limit=None returns the whole queue.
+def _pending_page(table, columns, after_id, before_id, limit):
+    where, params, order = f"{table}.status = 'pending'", [], "ASC"
+    if after_id is not None:
+        where += f" AND {table}.id > ?"
+        params.append(after_id)
+    if before_id is not None:
+        where += f" AND {table}.id < ?"
+        params.append(before_id)
+        order = "DESC"
+    sql = f'''SELECT {columns} FROM {table}
+              JOIN users ON {table}.user_id = users.id
+              WHERE {where} ORDER BY {table}.id {order}'''
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        SELECT payments.id, users.username, payments.amount, payments.payment_id
-        FROM payments
-        JOIN users ON payments.user_id = users.id
-        WHERE payments.status = 'pending'
-    ''')
+    c.execute(sql, params)
     rows = c.fetchall()
     conn.close()
+    if order == "DESC":
+        rows.reverse()
     return rows
 
+def _count_pending(table):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*) FROM {table} WHERE status = 'pending'")
+    count = c.fetchone()[0]
+    conn.close()
+    return count
+
+def get_pending_deposits(after_id=None, before_id=None, limit=None):
+    return _pending_page("payments",
+                         "payments.id, users.username, payments.amount, payments.payment_id",
+                         after_id, before_id, limit)
+
+def count_pending_deposits():
+    return _count_pending("payments")
+
 # ========== WITHDRAWALS ==========
 def request_withdrawal(telegram_id, amount, payout_method, payout_account):
     conn = get_connection()
     c = conn.cursor()
 
-    user_id = get_user_id(telegram_id)
-    if not user_id:
+    user = get_user_by_telegram_id(telegram_id)
+    if not user:
         conn.close()
         return "User not found."
-
-    c.execute("SELECT balance FROM users WHERE id = ?", (user_id,))
-    balance = c.fetchone()[0]
+    user_id, balance = user[0], user[3]
 
     if amount <= 0:
         conn.close()
@@ -716,11 +2386,14 @@ def approve_withdrawal(admin_id, withdrawal_id):
         return "User has insufficient balance now."
 
     c.execute("UPDATE users SET balance = balance - ? WHERE id = ?", (amount, user_id))
+    _record_balance_change(c, user_id, -amount, 'withdrawal', withdrawal_id)
     c.execute("INSERT INTO house_earnings (source, amount) VALUES ('withdrawal_fee', ?)", (fee,))
+    _bump_stats(c, total_house_earnings=fee)
     c.execute("UPDATE withdrawals SET status = 'approved' WHERE id = ?", (withdrawal_id,))
 
     conn.commit()
     conn.close()
+    _balances_changed({user_id: balance - amount})
     return "✅ Withdrawal approved. Pay user manually."
 
 def reject_withdrawal(admin_id, withdrawal_id):
@@ -734,23 +2407,147 @@ def reject_withdrawal(admin_id, withdrawal_id):
     conn.close()
     return "❌ Withdrawal rejected."
 
-def get_pending_withdrawals():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
-        SELECT withdrawals.id, users.username, withdrawals.amount,
-               withdrawals.fee, withdrawals.final_amount,
-               withdrawals.payout_method, withdrawals.payout_account
-        FROM withdrawals
-        JOIN users ON withdrawals.user_id = users.id
-        WHERE withdrawals.status = 'pending'
-    ''')
-    rows = c.fetchall()
-    conn.close()
-    return rows
+def get_pending_withdrawals(after_id=None, before_id=None, limit=None):
+    return _pending_page("withdrawals",
+                         "withdrawals.id, users.username, withdrawals.amount, "
+                         "withdrawals.fee, withdrawals.final_amount, "
+                         "withdrawals.payout_method, withdrawals.payout_account",
+                         after_id, before_id, limit)
+
+def count_pending_withdrawals():
+    return _count_pending("withdrawals")
+
+# ========== BATCH APPROVALS ==========
+# Bulk variants of approve/reject for deposits and withdrawals.  Requests are
+# validated first, the pending rows go into a temp table of row ids, and every
+# change is then applied with set-based statements in one transaction.  Each
+# returns [(requested id, message)] in request order.
+def _select_batch(c, table, key, requested, limit):
+    """Fill temp table batch_ids with pending rows; return (order, messages)."""
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS batch_ids (id INTEGER PRIMARY KEY)")
+    c.execute("DELETE FROM batch_ids")
+    messages = {}
+    pending = []
+    if requested is None:
+        c.execute(f"SELECT id, {key} FROM {table} WHERE status = 'pending' ORDER BY id LIMIT ?",
+                  (limit or BATCH_APPROVAL_LIMIT,))
+        rows = c.fetchall()
+        order = [row[1] for row in rows]
+        pending = [row[0] for row in rows]
+    else:
+        order = list(dict.fromkeys(requested))
+        found = {}
+        for start in range(0, len(order), 500):
+            chunk = order[start:start + 500]
+            c.execute(f"SELECT id, {key}, status FROM {table} WHERE {key} IN ({','.join('?' * len(chunk))})",
+                      chunk)
+            found.update((row[1], row) for row in c.fetchall())
+        for ref in order:
+            row = found.get(ref)
+            if not row:
+                messages[ref] = "Not found."
+            elif row[2] != 'pending':
+                messages[ref] = "Already processed."
+            else:
+                pending.append(row[0])
+    c.executemany("INSERT INTO batch_ids (id) VALUES (?)", [(row_id,) for row_id in pending])
+    return order, messages
+
+def _batch_ledger(c, table, delta_sql, reason, ref_column):
+    # One ledger entry per row with a running balance_after: the user's final
+    # balance minus the deltas of that user's later rows in this batch.
+    c.execute(f'''
+        INSERT INTO balance_ledger (user_id, delta, balance_after, reason, ref)
+        SELECT t.user_id, {delta_sql}, users.balance - COALESCE(SUM({delta_sql}) OVER (
+                   PARTITION BY t.user_id ORDER BY t.id
+                   ROWS BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING), 0),
+               ?, t.{ref_column}
+        FROM {table} t
+        JOIN batch_ids ON batch_ids.id = t.id
+        JOIN users ON users.id = t.user_id
+        ORDER BY t.user_id, t.id
+    ''', (reason,))
+
+def approve_deposits(admin_id, payment_ids=None, limit=None):
+    """Approve the given payment refs, or the oldest `limit` pending deposits."""
+    if admin_id != ADMIN_TELEGRAM_ID:
+        return [(ref, "⛔ Not authorized.") for ref in payment_ids or []]
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        order, messages = _select_batch(c, "payments", "payment_id", payment_ids, limit)
+        mark = _ledger_mark(c)
+        c.execute('''UPDATE users SET balance = balance + t.total + ? * t.n,
+                                      total_deposited = total_deposited + t.total
+                     FROM (SELECT user_id, SUM(amount) AS total, COUNT(*) AS n
+                           FROM payments JOIN batch_ids USING (id) GROUP BY user_id) AS t
+                     WHERE users.id = t.user_id''', (DEPOSIT_BONUS,))
+        _batch_ledger(c, "payments", f"t.amount + {int(DEPOSIT_BONUS)}", 'deposit', "payment_id")
+        c.execute("SELECT COALESCE(SUM(amount), 0) FROM payments JOIN batch_ids USING (id)")
+        _bump_stats(c, total_deposits=c.fetchone()[0])
+        c.execute('''UPDATE payments SET status = 'approved', approved_by = ?, approved_at = CURRENT_TIMESTAMP
+                     WHERE id IN (SELECT id FROM batch_ids)''', (admin_id,))
+        balances = _ledger_balances_since(c, mark)
+    _balances_changed(balances)
+    return [(ref, messages.get(ref, "✅ Approved.")) for ref in order]
+
+def reject_deposits(admin_id, payment_ids=None, limit=None):
+    if admin_id != ADMIN_TELEGRAM_ID:
+        return [(ref, "⛔ Not authorized.") for ref in payment_ids or []]
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        order, messages = _select_batch(c, "payments", "payment_id", payment_ids, limit)
+        c.execute("UPDATE payments SET status = 'rejected' WHERE id IN (SELECT id FROM batch_ids)")
+    return [(ref, messages.get(ref, "❌ Rejected.")) for ref in order]
+
+def approve_withdrawals(admin_id, withdrawal_ids=None, limit=None):
+    """Approve the given withdrawal ids, or the oldest `limit` pending ones.
+
+    A user's withdrawals are approved oldest first while their running total
+    still fits the current balance; the rest are left pending.
+    """
+    if admin_id != ADMIN_TELEGRAM_ID:
+        return [(wid, "⛔ Not authorized.") for wid in withdrawal_ids or []]
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        order, messages = _select_batch(c, "withdrawals", "id", withdrawal_ids, limit)
+        c.execute('''SELECT id FROM (
+                         SELECT w.id, users.balance,
+                                SUM(w.amount) OVER (PARTITION BY w.user_id ORDER BY w.id) AS running
+                         FROM withdrawals w
+                         JOIN batch_ids ON batch_ids.id = w.id
+                         JOIN users ON users.id = w.user_id)
+                     WHERE running > balance''')
+        short = [row[0] for row in c.fetchall()]
+        for wid in short:
+            messages[wid] = "User has insufficient balance now."
+        c.executemany("DELETE FROM batch_ids WHERE id = ?", [(wid,) for wid in short])
+        mark = _ledger_mark(c)
+
+        c.execute('''UPDATE users SET balance = balance - t.total
+                     FROM (SELECT user_id, SUM(amount) AS total
+                           FROM withdrawals JOIN batch_ids USING (id) GROUP BY user_id) AS t
+                     WHERE users.id = t.user_id''')
+        _batch_ledger(c, "withdrawals", "-t.amount", 'withdrawal', "id")
+        c.execute('''INSERT INTO house_earnings (source, amount)
+                     SELECT 'withdrawal_fee', fee FROM withdrawals JOIN batch_ids USING (id)''')
+        c.execute("SELECT COALESCE(SUM(fee), 0) FROM withdrawals JOIN batch_ids USING (id)")
+        _bump_stats(c, total_house_earnings=c.fetchone()[0])
+        c.execute("UPDATE withdrawals SET status = 'approved' WHERE id IN (SELECT id FROM batch_ids)")
+        balances = _ledger_balances_since(c, mark)
+    _balances_changed(balances)
+    return [(wid, messages.get(wid, "✅ Approved. Pay user manually.")) for wid in order]
+
+def reject_withdrawals(admin_id, withdrawal_ids=None, limit=None):
+    if admin_id != ADMIN_TELEGRAM_ID:
+        return [(wid, "⛔ Not authorized.") for wid in withdrawal_ids or []]
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        order, messages = _select_batch(c, "withdrawals", "id", withdrawal_ids, limit)
+        c.execute("UPDATE withdrawals SET status = 'rejected' WHERE id IN (SELECT id FROM batch_ids)")
+    return [(wid, messages.get(wid, "❌ Rejected.")) for wid in order]
 
 # ========== ADMIN FUNCTIONS ==========
-def reset_round(admin_telegram_id):
+def reset_round(admin_telegram_id, room_id=DEFAULT_ROOM_ID):
     if admin_telegram_id != ADMIN_TELEGRAM_ID:
         return "⛔ You are not admin."
 
@@ -760,23 +2557,35 @@ def reset_round(admin_telegram_id):
     c.execute('''
         UPDATE game_rounds
         SET status = 'finished', ended_at = CURRENT_TIMESTAMP
-        WHERE status = 'active'
-    ''')
-    c.execute("DELETE FROM user_cards")
+        WHERE room_id = ? AND status = 'active'
+    ''', (room_id,))
+    c.execute("DELETE FROM user_cards WHERE room_id = ?", (room_id,))
     conn.commit()
     conn.close()
+    _reset_round_states()
+    _reset_winner_trackers()
 
-    new_round_id = start_new_round()
+    new_round_id = start_new_round(room_id)
     return f"♻ Round reset. New round started (ID: {new_round_id})"
 
-def set_card_price(admin_telegram_id, new_price):
+def set_card_price(admin_telegram_id, new_price, room_id=None):
+    """Set the default card price, or (with room_id) the price in one room."""
     if admin_telegram_id != ADMIN_TELEGRAM_ID:
         return "⛔ You are not admin."
     conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE game_settings SET card_price = ? WHERE id = 1", (new_price,))
+    if room_id is None:
+        c.execute("UPDATE game_settings SET card_price = ? WHERE id = 1", (new_price,))
+    else:
+        c.execute("UPDATE rooms SET card_price = ? WHERE id = ?", (new_price, room_id))
+        if c.rowcount == 0:
+            conn.close()
+            return "Room not found."
     conn.commit()
     conn.close()
+    _reset_rooms()
+    if room_id is not None:
+        return f"✅ Card price in room {room_id} updated to {new_price}."
     return f"✅ Card price updated to {new_price}."
 
 def set_house_percent(admin_telegram_id, new_percent):
@@ -799,43 +2608,60 @@ def set_withdrawal_fee(admin_telegram_id, new_percent):
     conn.close()
     return f"✅ Withdrawal fee updated to {new_percent}%."
 
-def set_round_duration(admin_telegram_id, new_duration_seconds):
+def set_round_duration(admin_telegram_id, new_duration_seconds, room_id=DEFAULT_ROOM_ID):
     if admin_telegram_id != ADMIN_TELEGRAM_ID:
         return "⛔ You are not admin."
     conn = get_connection()
     c = conn.cursor()
-    round_id = get_active_round()
-    if round_id:
-        c.execute("UPDATE game_rounds SET duration_seconds = ? WHERE id = ?", (new_duration_seconds, round_id))
+    state = get_round_state(room_id=room_id)
+    c.execute("UPDATE rooms SET duration_seconds = ? WHERE id = ?", (new_duration_seconds, room_id))
+    if state:
+        c.execute("UPDATE game_rounds SET duration_seconds = ? WHERE id = ?", (new_duration_seconds, state.id))
     conn.commit()
     conn.close()
+    _reset_rooms()
+    if state:
+        state.set_duration(new_duration_seconds)
     return f"✅ Round duration updated to {new_duration_seconds} seconds."
 
+# ----- Running totals -----
+# stats_counters holds the admin_stats totals as one row, bumped inside the same
+# transaction as every change that affects them (create_user, approve_deposit,
+# handle_winner, approve_withdrawal, start_new_round).  rebuild_stats()
+# recomputes it from the base tables if it ever drifts.
+_STATS_COLUMNS = ("total_users", "total_deposits", "total_rounds", "total_house_earnings")
+
+def _bump_stats(c, **deltas):
+    assignments = ", ".join(f"{column} = {column} + ?" for column in deltas if column in _STATS_COLUMNS)
+    c.execute(f"UPDATE stats_counters SET {assignments} WHERE id = 1", tuple(deltas.values()))
+
+def _rebuild_stats(c):
+    c.execute('''INSERT OR REPLACE INTO stats_counters
+                 (id, total_users, total_deposits, total_rounds, total_house_earnings)
+                 SELECT 1,
+                        (SELECT COUNT(*) FROM users),
+                        (SELECT COALESCE(SUM(total_deposited), 0) FROM users),
+                        (SELECT COUNT(*) FROM game_rounds),
+                        (SELECT COALESCE(SUM(amount), 0) FROM house_earnings)''')
+
+def rebuild_stats(admin_telegram_id):
+    if admin_telegram_id != ADMIN_TELEGRAM_ID:
+        return "⛔ You are not admin."
+    with transaction(immediate=True) as conn:
+        _rebuild_stats(conn.cursor())
+    return "✅ Stats rebuilt from base tables."
+
 def admin_stats():
     conn = get_connection()
     c = conn.cursor()
-
-    c.execute("SELECT COUNT(*) FROM users")
-    total_users = c.fetchone()[0]
-
-    c.execute("SELECT SUM(total_deposited) FROM users")
-    total_deposits = c.fetchone()[0] or 0
-
-    c.execute("SELECT prize_pool FROM game_rounds WHERE status='active'")
-    row = c.fetchone()
-    current_prize_pool = row[0] if row else 0
-
-    c.execute("SELECT COUNT(*) FROM game_rounds")
-    total_rounds = c.fetchone()[0]
-
-    c.execute("SELECT SUM(amount) FROM house_earnings")
-    total_house = c.fetchone()[0] or 0
-
+    c.execute('''SELECT total_users, total_deposits, total_rounds, total_house_earnings
+                 FROM stats_counters WHERE id = 1''')
+    total_users, total_deposits, total_rounds, total_house = c.fetchone() or (0, 0, 0, 0)
     conn.close()
     return {
         "total_users": total_users,
         "total_deposits": total_deposits,
-        "current_prize_pool": current_prize_pool,
+        "current_prize_pool": sum(state.prize_pool for state in get_active_rounds()),
         "total_rounds": total_rounds,
         "total_house_earnings": total_house
     }
@@ -843,6 +2669,7 @@ def admin_stats():
 # ========== INITIALISE ON IMPORT ==========
 try:
     init_db()
+    load_card_catalogue()
     print("✅ Database initialized successfully.")
 except Exception as e:
     print(f"❌ ERROR initializing database: {e}")
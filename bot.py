@@ -1,97 +1,263 @@
+import asyncio
 import logging
 import json
 import os
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from telegram.error import Forbidden, RetryAfter, TelegramError
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 
-# Import database functions
-from bingo_db import (
-    get_user_by_telegram_id, create_user, get_user_balance,
-    buy_card, get_all_cards_with_status, get_user_cards,
-    get_called_numbers, check_card_winner, handle_winner,
-    get_cardboard_as_grid, reset_round, set_card_price,
-    admin_stats, request_deposit, get_pending_deposits,
-    approve_deposit, request_withdrawal, get_pending_withdrawals,
-    approve_withdrawal
-)
+# Database access: blocking SQLite work runs off the event loop via async_db.
+import async_db as db
+from round_scheduler import RoundScheduler
 
 # ========== CONFIGURATION ==========
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "6835994100"))
 WEB_APP_URL = os.getenv("WEB_APP_URL", "https://your-app.up.railway.app/")  # Root URL of your Flask app
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))        # messages/second, Telegram allows ~30
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+LEDGER_CHECKPOINT_SECONDS = float(os.getenv("LEDGER_CHECKPOINT_SECONDS", "3600"))  # 0 disables
 
 # Enable logging
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ========== BROADCAST ==========
+class Broadcaster:
+    """Rate-limited fan-out of round news to players.
+
+    Messages are queued per chat: while a chat is waiting for its turn, further
+    called numbers are merged into its pending message, so a backlog never
+    grows past one message per player.  Workers share a token bucket of
+    BROADCAST_RATE messages/second and all back off when Telegram answers
+    RetryAfter.
+    """
+
+    def __init__(self, bot, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS):
+        self.bot = bot
+        self.rate = rate
+        self.worker_count = workers
+        self._tokens = rate
+        self._refilled = time.monotonic()
+        self._resume_at = 0.0
+        self._bucket_lock = asyncio.Lock()
+        self._pending = {}      # chat_id -> {"numbers": [...], "texts": [...]}
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _enqueue(self, chat_id, number=None, text=None):
+        entry = self._pending.get(chat_id)
+        if entry is None:
+            entry = self._pending[chat_id] = {"numbers": [], "texts": []}
+            self._queue.put_nowait(chat_id)
+        if number is not None:
+            entry["numbers"].append(number)
+        if text is not None:
+            entry["texts"].append(text)
+
+    def announce_call(self, recipients, number):
+        for chat_id in recipients:
+            self._enqueue(chat_id, number=number)
+
+    def announce(self, recipients, text):
+        for chat_id in recipients:
+            self._enqueue(chat_id, text=text)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {"sent": self.sent, "failed": self.failed, "backlog": len(self._pending),
+                "throughput": self.sent / elapsed}
+
+    async def _take_token(self):
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                self._tokens = min(self.rate, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _work(self):
+        while True:
+            chat_id = await self._queue.get()
+            entry = self._pending.pop(chat_id, None)
+            if not entry:
+                continue
+            parts = []
+            if entry["numbers"]:
+                parts.append("🎱 Called: " + ", ".join(map(str, entry["numbers"])))
+            parts.extend(entry["texts"])
+            await self._take_token()
+            try:
+                await self.bot.send_message(chat_id, "\n".join(parts))
+                self.sent += 1
+            except RetryAfter as e:
+                retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+                self._resume_at = time.monotonic() + retry_after
+                # Put the message back, merging with anything queued meanwhile.
+                for number in entry["numbers"]:
+                    self._enqueue(chat_id, number=number)
+                for text in entry["texts"]:
+                    self._enqueue(chat_id, text=text)
+            except Forbidden:
+                self.failed += 1    # user blocked the bot; nothing to retry
+            except TelegramError as e:
+                self.failed += 1
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+
 # ========== USER COMMANDS ==========
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db_user = get_user_by_telegram_id(user.id)
+    db_user = await db.get_user_by_telegram_id(user.id)
     if not db_user:
-        create_user(user.id, user.username or "Unknown")
+        await db.create_user(user.id, user.username or "Unknown")
         await update.message.reply_text("Welcome! You are now registered.")
     else:
         await update.message.reply_text("Welcome back!")
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bal = get_user_balance(update.effective_user.id)
+    bal = await db.get_user_balance(update.effective_user.id)
     await update.message.reply_text(f"Your balance: {bal} ETB")
 
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Usage: /history [before_id]  (before_id pages further back)
+    before_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+    entries = await db.get_balance_history(update.effective_user.id, before_id)
+    if not entries:
+        await update.message.reply_text("No balance history.")
+        return
+    lines = [f"#{entry_id} {created_at}: {delta:+} ({reason}) → {balance_after} ETB"
+             for entry_id, delta, balance_after, reason, ref, created_at in entries]
+    lines.append(f"Older: /history {entries[-1][0]}")
+    await update.message.reply_text("\n".join(lines))
+
+async def rooms(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    current = await db.get_user_room(update.effective_user.id)
+    lines = ["🏠 Rooms (join with /join <id>):"]
+    for room in (await db.get_rooms()).values():
+        marker = " ← you" if room["id"] == current else ""
+        lines.append(f"{room['id']}. {room['name']} – card {room['card_price']} ETB, "
+                     f"round {room['duration']}s{marker}")
+    await update.message.reply_text("\n".join(lines))
+
+async def join(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        room_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /join <room_id>")
+        return
+    msg = await db.set_user_room(update.effective_user.id, room_id)
+    await update.message.reply_text(msg)
+
+# ----- Card picker (pages of free cards, keyboards cached per availability version) -----
+BUY_PAGE_SIZE = 20
+BUY_ROW_WIDTH = 5
+_buy_keyboards = {}     # (room_id, version, after_id, before_id) -> InlineKeyboardMarkup
+
+async def _buy_keyboard(room_id, after_id=None, before_id=None):
+    version, card_ids, has_prev, has_next = await db.get_free_card_page(
+        room_id, after_id, before_id, BUY_PAGE_SIZE)
+    if not card_ids:
+        return None
+    key = (room_id, version, after_id, before_id)
+    markup = _buy_keyboards.get(key)
+    if markup is None:
+        if len(_buy_keyboards) > 512:
+            _buy_keyboards.clear()      # old versions are never asked for again
+        rows = [[InlineKeyboardButton(str(card_id), callback_data=f"buy_{card_id}")
+                 for card_id in card_ids[i:i + BUY_ROW_WIDTH]]
+                for i in range(0, len(card_ids), BUY_ROW_WIDTH)]
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"buypage_{room_id}_b_{card_ids[0]}"))
+        if has_next:
+            nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"buypage_{room_id}_a_{card_ids[-1]}"))
+        if nav:
+            rows.append(nav)
+        markup = _buy_keyboards[key] = InlineKeyboardMarkup(rows)
+    return markup
+
 async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cards = get_all_cards_with_status()
-    # Show only first 20 available cards (you can implement pagination)
-    keyboard = []
-    count = 0
-    for card in cards:
-        if not card['taken']:
-            keyboard.append([InlineKeyboardButton(f"Card {card['id']}", callback_data=f"buy_{card['id']}")])
-            count += 1
-            if count >= 20:
-                break
-    if not keyboard:
+    room_id = await db.get_user_room(update.effective_user.id)
+    reply_markup = await _buy_keyboard(room_id)
+    if not reply_markup:
         await update.message.reply_text("No cards available.")
         return
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Choose a card to buy:", reply_markup=reply_markup)
 
+async def buy_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, room_id, direction, cursor = query.data.split("_")
+    if direction == "a":
+        reply_markup = await _buy_keyboard(int(room_id), after_id=int(cursor))
+    else:
+        reply_markup = await _buy_keyboard(int(room_id), before_id=int(cursor))
+    if not reply_markup:
+        await query.edit_message_text("No cards available.")
+        return
+    await query.edit_message_text("Choose a card to buy:", reply_markup=reply_markup)
+
 async def buy_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     data = query.data
     if data.startswith("buy_"):
         card_id = int(data.split("_")[1])
-        success, msg = buy_card(update.effective_user.id, card_id)
+        room_id = await db.get_user_room(update.effective_user.id)
+        success, msg = await db.buy_card(update.effective_user.id, card_id, room_id)
         await query.edit_message_text(msg)
 
 async def mycards(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cards = get_user_cards(update.effective_user.id)
+    room_id = await db.get_user_room(update.effective_user.id)
+    cards = await db.get_user_cards(update.effective_user.id, room_id)
     if not cards:
         await update.message.reply_text("You have no cards.")
     else:
         await update.message.reply_text(f"Your cards: {', '.join(map(str, cards))}")
 
 async def called(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    nums = get_called_numbers()
+    room_id = await db.get_user_room(update.effective_user.id)
+    nums = await db.get_called_numbers(room_id=room_id)
     if nums:
         await update.message.reply_text(f"Called numbers: {', '.join(map(str, nums))}")
     else:
         await update.message.reply_text("No numbers called yet.")
 
 async def view(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cards = get_user_cards(update.effective_user.id)
+    room_id = await db.get_user_room(update.effective_user.id)
+    cards = await db.get_user_cards(update.effective_user.id, room_id)
     if not cards:
         await update.message.reply_text("You have no cards.")
         return
     card_id = cards[0]   # For simplicity, show the first card
-    web_app_url = f"{WEB_APP_URL}?card={card_id}"
+    web_app_url = f"{WEB_APP_URL}?card={card_id}&room={room_id}"
     keyboard = [[InlineKeyboardButton("View My Card", web_app=WebAppInfo(url=web_app_url))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Click below to view your bingo card:", reply_markup=reply_markup)
 
 async def shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Open the web‑based shop to browse and buy cards."""
-    web_app_url = f"{WEB_APP_URL}shop"
+    room_id = await db.get_user_room(update.effective_user.id)
+    web_app_url = f"{WEB_APP_URL}shop?room={room_id}"
     keyboard = [[InlineKeyboardButton("🛒 Buy Cards", web_app=WebAppInfo(url=web_app_url))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Click below to browse and buy cards:", reply_markup=reply_markup)
@@ -100,20 +266,21 @@ async def web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = json.loads(update.effective_message.web_app_data.data)
     action = data.get('action')
     if action == 'win':
-        card_id = data.get('cardId')
         user_id = update.effective_user.id
-        # Verify user owns this card
-        user_cards = get_user_cards(user_id)
-        if card_id not in user_cards:
-            await update.message.reply_text("You don't own this card.")
-            return
-        called = get_called_numbers()
-        card_grid = get_cardboard_as_grid(card_id)
-        if card_grid and check_card_winner(card_grid, called):
-            result = handle_winner(user_id)
-            await update.message.reply_text(result)
-        else:
-            await update.message.reply_text("Not a winning card yet.")
+        try:
+            room_id = int(data.get('roomId') or await db.get_user_room(user_id))
+        except (TypeError, ValueError):
+            room_id = await db.get_user_room(user_id)
+        round_id = await db.get_active_round(room_id)
+        # Ownership, the win check and payout all happen in claim_win, which
+        # settles simultaneous claims for the round together.
+        paid, result = await db.claim_win(user_id, data.get('cardId'), room_id)
+        await update.message.reply_text(result)
+        scheduler = context.application.bot_data.get("scheduler")
+        if paid and scheduler and round_id:
+            # The scheduler announces the result to the round's players now
+            # rather than at the round's next timer.
+            scheduler.check(round_id)
 
 # ========== DEPOSIT COMMANDS ==========
 async def deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -124,7 +291,7 @@ async def deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except (IndexError, ValueError):
         await update.message.reply_text("Usage: /deposit <amount> <transaction_ref>")
         return
-    msg = request_deposit(update.effective_user.id, amount, ref)
+    msg = await db.request_deposit(update.effective_user.id, amount, ref)
     await update.message.reply_text(msg)
 
 # ========== WITHDRAWAL COMMANDS ==========
@@ -137,34 +304,59 @@ async def withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except (IndexError, ValueError):
         await update.message.reply_text("Usage: /withdraw <amount> <method> <account>")
         return
-    msg = request_withdrawal(update.effective_user.id, amount, method, account)
+    msg = await db.request_withdrawal(update.effective_user.id, amount, method, account)
     await update.message.reply_text(msg)
 
 # ========== ADMIN COMMANDS ==========
+def _room_from_args(args, position=0):
+    """Optional room id argument of admin commands (defaults to the main room)."""
+    if len(args) > position and args[position].isdigit():
+        return int(args[position])
+    return db.DEFAULT_ROOM_ID
+
 async def admin_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Usage: /resetround [room_id]
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("Unauthorized.")
         return
-    msg = reset_round(update.effective_user.id)
+    msg = await db.reset_round(update.effective_user.id, _room_from_args(context.args))
     await update.message.reply_text(msg)
 
 async def admin_setprice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Usage: /setprice <new_price> [room_id]  (without a room: the default price)
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("Unauthorized.")
         return
     try:
         new_price = int(context.args[0])
+        room_id = int(context.args[1]) if len(context.args) > 1 else None
     except (IndexError, ValueError):
-        await update.message.reply_text("Usage: /setprice <new_price>")
+        await update.message.reply_text("Usage: /setprice <new_price> [room_id]")
         return
-    msg = set_card_price(update.effective_user.id, new_price)
+    msg = await db.set_card_price(update.effective_user.id, new_price, room_id)
+    await update.message.reply_text(msg)
+
+async def admin_newroom(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Usage: /newroom <name> [card_price] [duration_seconds]
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    try:
+        name = context.args[0]
+        price = int(context.args[1]) if len(context.args) > 1 else None
+        duration = int(context.args[2]) if len(context.args) > 2 else None
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /newroom <name> [card_price] [duration_seconds]")
+        return
+    msg = await db.create_room(update.effective_user.id, name, price, duration)
+    context.application.bot_data["scheduler"].wake()
     await update.message.reply_text(msg)
 
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("Unauthorized.")
         return
-    stats = admin_stats()
+    stats = await db.admin_stats()
     text = (
         f"📊 Admin Statistics\n"
         f"Total users: {stats['total_users']}\n"
@@ -175,19 +367,90 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(text)
 
-async def admin_pending_deposits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_rebuild_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("Unauthorized.")
         return
-    pending = get_pending_deposits()
-    if not pending:
-        await update.message.reply_text("No pending deposits.")
+    msg = await db.rebuild_stats(update.effective_user.id)
+    await update.message.reply_text(msg)
+
+async def admin_verify_ledger(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    mismatches = await db.verify_ledger(checkpoint=True)
+    if not mismatches:
+        await update.message.reply_text("✅ Ledger matches every balance. Snapshot recorded.")
         return
-    text = "Pending deposits:\n"
-    for pid, username, amount, ref in pending:
-        text += f"ID: {pid} | User: {username} | Amount: {amount} | Ref: {ref}\n"
+    text = "❌ Ledger mismatches:\n"
+    for user_id, balance, replayed in mismatches[:50]:
+        text += f"User {user_id}: balance {balance}, ledger {replayed}\n"
     await update.message.reply_text(text)
 
+# ----- Pending queues (keyset pages with prev/next buttons) -----
+def _format_deposit(row):
+    pid, username, amount, ref = row
+    return f"ID: {pid} | User: {username} | Amount: {amount} | Ref: {ref}"
+
+def _format_withdrawal(row):
+    wid, username, amount, fee, final_amount, method, account = row
+    return (f"ID: {wid} | User: {username} | Amount: {amount} (fee {fee}, pay {final_amount}) | "
+            f"{method}: {account}")
+
+PENDING_QUEUES = {
+    "dep": ("deposits", db.get_pending_deposits, db.count_pending_deposits, _format_deposit),
+    "wd": ("withdrawals", db.get_pending_withdrawals, db.count_pending_withdrawals, _format_withdrawal),
+}
+
+async def _pending_page(kind, after_id=None, before_id=None):
+    """Text and keyboard for one page of a pending queue."""
+    title, fetch, count, fmt = PENDING_QUEUES[kind]
+    rows = await fetch(after_id=after_id, before_id=before_id, limit=db.PENDING_PAGE_SIZE + 1)
+    # One extra row tells whether there is more in the direction we moved.
+    more = len(rows) > db.PENDING_PAGE_SIZE
+    if before_id is not None:
+        rows = rows[1:] if more else rows
+        has_prev, has_next = more, True
+    else:
+        rows = rows[:db.PENDING_PAGE_SIZE]
+        has_prev, has_next = after_id is not None, more
+    if not rows:
+        return f"No pending {title}.", None
+    total = await count()
+    text = f"Pending {title} ({total}):\n" + "\n".join(fmt(row) for row in rows)
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"pending_{kind}_b_{rows[0][0]}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"pending_{kind}_a_{rows[-1][0]}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def admin_pending_deposits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    text, markup = await _pending_page("dep")
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def admin_pending_withdrawals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    text, markup = await _pending_page("wd")
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def pending_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if update.effective_user.id != ADMIN_ID:
+        return
+    _, kind, direction, cursor = query.data.split("_")
+    if direction == "a":
+        text, markup = await _pending_page(kind, after_id=int(cursor))
+    else:
+        text, markup = await _pending_page(kind, before_id=int(cursor))
+    await query.edit_message_text(text, reply_markup=markup)
+
 async def admin_approve_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("Unauthorized.")
@@ -197,14 +460,153 @@ async def admin_approve_deposit(update: Update, context: ContextTypes.DEFAULT_TY
     except IndexError:
         await update.message.reply_text("Usage: /approve_deposit <payment_id>")
         return
-    msg = approve_deposit(update.effective_user.id, payment_id)
+    msg = await db.approve_deposit(update.effective_user.id, payment_id)
     await update.message.reply_text(msg)
 
+async def _run_batch(update, context, action, label, numeric):
+    """Shared body of the /approve* and /reject* batch commands.
+
+    Arguments are either ids, or "all [N]" for the oldest N pending items.
+    """
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    args = context.args
+    ids, limit = None, None
+    if args and args[0].lower() == "all":
+        try:
+            limit = int(args[1]) if len(args) > 1 else None
+        except ValueError:
+            limit = -1
+    else:
+        try:
+            ids = [int(a) if numeric else a for a in args]
+        except ValueError:
+            ids = []
+    if (ids is not None and not ids) or (limit is not None and limit <= 0):
+        await update.message.reply_text(f"Usage: /{label} <id> [<id> ...] | all [N]")
+        return
+    results = await action(update.effective_user.id, ids, limit)
+    if not results:
+        await update.message.reply_text("Nothing pending.")
+        return
+    lines = [f"{ref}: {message}" for ref, message in results]
+    done = sum(1 for _, message in results if message.startswith(("✅", "❌")))
+    text = f"/{label}: {done}/{len(results)} processed\n"
+    for line in lines:
+        if len(text) + len(line) > 4000:
+            await update.message.reply_text(text)
+            text = ""
+        text += line + "\n"
+    await update.message.reply_text(text)
+
+async def admin_approve_deposits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_batch(update, context, db.approve_deposits, "approvedeposits", numeric=False)
+
+async def admin_reject_deposits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_batch(update, context, db.reject_deposits, "rejectdeposits", numeric=False)
+
+async def admin_approve_withdrawals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_batch(update, context, db.approve_withdrawals, "approvewithdrawals", numeric=True)
+
+async def admin_reject_withdrawals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _run_batch(update, context, db.reject_withdrawals, "rejectwithdrawals", numeric=True)
+
+async def admin_pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    round_id = await db.get_active_round(_room_from_args(context.args))
+    if not round_id:
+        await update.message.reply_text("No active round.")
+        return
+    await db.pause_round(round_id)
+    await update.message.reply_text(f"⏸ Round {round_id} paused.")
+
+async def admin_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    round_id = await db.get_active_round(_room_from_args(context.args))
+    if not round_id:
+        await update.message.reply_text("No active round.")
+        return
+    await context.application.bot_data["scheduler"].resume(round_id)
+    await update.message.reply_text(f"▶️ Round {round_id} resumed.")
+
+async def admin_broadcast_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Unauthorized.")
+        return
+    stats = context.application.bot_data["broadcaster"].stats()
+    await update.message.reply_text(
+        f"📣 Broadcast\n"
+        f"Sent: {stats['sent']}\n"
+        f"Failed: {stats['failed']}\n"
+        f"Backlog: {stats['backlog']} players\n"
+        f"Throughput: {stats['throughput']:.1f} msg/s"
+    )
+
 # Similar for withdrawals (you can add them as needed)
 
 # ========== MAIN ==========
+async def start_scheduler(application: Application):
+    broadcaster = Broadcaster(application.bot)
+    broadcaster.start()
+    application.bot_data["broadcaster"] = broadcaster
+
+    async def on_round_event(kind, room_id, round_id, payload):
+        logger.info("Room %s round %s %s: %s", room_id, round_id, kind, payload)
+        recipients = await db.get_round_recipients(room_id)
+        if kind == "call":
+            broadcaster.announce_call(recipients, payload)
+        else:
+            broadcaster.announce(recipients, f"Round {round_id} ended: {payload}")
+
+    scheduler = RoundScheduler(on_event=on_round_event)
+    application.bot_data["scheduler"] = scheduler
+    await scheduler.start()
+
+    if LEDGER_CHECKPOINT_SECONDS > 0:
+        application.bot_data["ledger_checkpoints"] = asyncio.create_task(
+            checkpoint_ledger_forever(application), name="ledger-checkpoints")
+
+async def checkpoint_ledger_forever(application: Application):
+    """Verify the ledger and record balance snapshots every LEDGER_CHECKPOINT_SECONDS,
+    so /verifyledger and later checks only replay recent entries."""
+    while True:
+        await asyncio.sleep(LEDGER_CHECKPOINT_SECONDS)
+        try:
+            mismatches = await db.verify_ledger(checkpoint=True)
+        except Exception:
+            logger.exception("Ledger checkpoint failed")
+            continue
+        if mismatches:
+            logger.warning("Ledger mismatches, no snapshot recorded: %s", mismatches[:50])
+            try:
+                await application.bot.send_message(
+                    ADMIN_ID, f"❌ Ledger check found {len(mismatches)} mismatch(es). Run /verifyledger.")
+            except TelegramError:
+                logger.exception("Could not report ledger mismatches")
+
+async def shutdown(application: Application):
+    checkpoints = application.bot_data.get("ledger_checkpoints")
+    if checkpoints:
+        checkpoints.cancel()
+    scheduler = application.bot_data.get("scheduler")
+    if scheduler:
+        await scheduler.stop()
+    broadcaster = application.bot_data.get("broadcaster")
+    if broadcaster:
+        await broadcaster.stop()
+    db.shutdown()
+
+
 def main():
-    app = Application.builder().token(TOKEN).build()
+    app = (Application.builder().token(TOKEN)
+           .post_init(start_scheduler)
+           .post_shutdown(shutdown)
+           .build())
 
     # User commands
     app.add_handler(CommandHandler("start", start))
@@ -216,17 +618,33 @@ def main():
     app.add_handler(CommandHandler("shop", shop))               # New shop command
     app.add_handler(CommandHandler("deposit", deposit))
     app.add_handler(CommandHandler("withdraw", withdraw))
+    app.add_handler(CommandHandler("history", history))
+    app.add_handler(CommandHandler("rooms", rooms))
+    app.add_handler(CommandHandler("join", join))
 
     # Admin commands
     app.add_handler(CommandHandler("resetround", admin_reset))
     app.add_handler(CommandHandler("setprice", admin_setprice))
+    app.add_handler(CommandHandler("newroom", admin_newroom))
     app.add_handler(CommandHandler("stats", admin_stats))
+    app.add_handler(CommandHandler("rebuildstats", admin_rebuild_stats))
+    app.add_handler(CommandHandler("verifyledger", admin_verify_ledger))
     app.add_handler(CommandHandler("pendingdeposits", admin_pending_deposits))
+    app.add_handler(CommandHandler("pendingwithdrawals", admin_pending_withdrawals))
     app.add_handler(CommandHandler("approvedeposit", admin_approve_deposit))
+    app.add_handler(CommandHandler("approvedeposits", admin_approve_deposits))
+    app.add_handler(CommandHandler("rejectdeposits", admin_reject_deposits))
+    app.add_handler(CommandHandler("approvewithdrawals", admin_approve_withdrawals))
+    app.add_handler(CommandHandler("rejectwithdrawals", admin_reject_withdrawals))
+    app.add_handler(CommandHandler("pause", admin_pause))
+    app.add_handler(CommandHandler("resume", admin_resume))
+    app.add_handler(CommandHandler("broadcaststats", admin_broadcast_stats))
     # Add similar for withdrawals if desired
 
     # Callbacks
     app.add_handler(CallbackQueryHandler(buy_callback, pattern="^buy_"))
+    app.add_handler(CallbackQueryHandler(buy_page_callback, pattern="^buypage_"))
+    app.add_handler(CallbackQueryHandler(pending_callback, pattern="^pending_"))
     app.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, web_app_data))
 
     logger.info("Bot started")
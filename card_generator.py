@@ -0,0 +1,100 @@
+"""Generate and load large sets of unique bingo cards.
+
+Cards use the same flat layout as ALL_CARDS: 25 numbers, five per letter
+(B 1-15, I 16-30, N 31-45, G 46-60, O 61-75), each group drawn without
+repetition, with "FREE" in the middle of N.  Every card is reduced to a
+25-byte key and checked against a set of the keys seen so far, so no two
+cards in a set (or in the database, when loading) are the same.
+
+    python -m card_generator 10000              # generate and time only
+    python -m card_generator 10000 --load       # append to the database
+    python -m card_generator --benchmark        # time 10k and 100k cards
+"""
+import argparse
+import random
+import sys
+import time
+
+COLUMN_RANGES = [range(start, start + 15) for start in (1, 16, 31, 46, 61)]
+FREE_INDEX = 12
+
+
+def card_key(numbers):
+    """Compact hashable key of a card (FREE stored as 0)."""
+    return bytes(0 if n == "FREE" else n for n in numbers)
+
+
+def generate_cards(count, seed=None, existing=()):
+    """Return `count` new cards, none equal to each other or to `existing`."""
+    rng = random.Random(seed)
+    sample = rng.sample
+    seen = {card_key(numbers) for numbers in existing}
+    cards = []
+    while len(cards) < count:
+        numbers = []
+        for column in COLUMN_RANGES:
+            numbers.extend(sample(column, 5))
+        numbers[FREE_INDEX] = "FREE"
+        key = card_key(numbers)
+        if key in seen:
+            continue
+        seen.add(key)
+        cards.append(numbers)
+    return cards
+
+
+def load_cards(count, seed=None):
+    """Generate `count` cards unique against the database and append them."""
+    import bingo_db
+
+    existing = bingo_db.get_card_catalogue()
+    cards = generate_cards(count, seed, (existing.numbers(card_id) for card_id in existing.ids))
+    return bingo_db.add_cardboards(cards)
+
+
+def _timed(label, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    print(f"{label:32s} {time.perf_counter() - started:8.3f} s")
+    return result
+
+
+def benchmark(sizes=(10_000, 100_000)):
+    """Time generating and loading cards into a throwaway database."""
+    import os
+    import tempfile
+
+    # bingo_db picks its database path on import; once imported it points at
+    # the real volume, and the benchmark would append its cards there.
+    if "bingo_db" in sys.modules:
+        raise RuntimeError("benchmark() must run before bingo_db is imported")
+    os.environ["RAILWAY_VOLUME_MOUNT_PATH"] = tempfile.mkdtemp(prefix="bingo_cards_")
+    import bingo_db
+
+    for size in sizes:
+        catalogue = bingo_db.get_card_catalogue()
+        existing = [catalogue.numbers(card_id) for card_id in catalogue.ids]
+        cards = _timed(f"generate {size} cards", generate_cards, size, size, existing)
+        _timed(f"load {size} cards", bingo_db.add_cardboards, cards)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate unique bingo cards.")
+    parser.add_argument("count", type=int, nargs="?", default=10_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--load", action="store_true", help="append the cards to the database")
+    parser.add_argument("--benchmark", action="store_true", help="time 10k and 100k cards")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark()
+    elif args.load:
+        ids = _timed(f"generate + load {args.count} cards", load_cards, args.count, args.seed)
+        if ids:
+            print(f"✅ Cards {ids[0]}-{ids[-1]} added.")
+    else:
+        _timed(f"generate {args.count} cards", generate_cards, args.count, args.seed)
+
+
+if __name__ == "__main__":
+    main()
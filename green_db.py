@@ -0,0 +1,75 @@
+"""Gevent facade over bingo_db for the web API.
+
+Under gunicorn's gevent worker every request is a greenlet on one hub
+thread, and bingo_db blocks on SQLite (a busy database is waited out inside
+SQLite, where gevent cannot switch away).  These wrappers run each call on a
+small pool of native threads instead, so the hub keeps serving other
+requests, and each of those threads keeps one pooled connection rather than
+every greenlet opening its own.  Like async_db, writes get a single thread,
+reads a bounded pool and win claims their own threads.  Outside a
+monkey-patched process (the Flask dev server, scripts) calls go straight
+through.
+"""
+import functools
+import os
+
+try:
+    from gevent import monkey
+    from gevent.threadpool import ThreadPool
+except ImportError:   # not running under gevent: call bingo_db directly
+    monkey = None
+
+import bingo_db
+
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", "4"))
+DB_CLAIM_THREADS = int(os.getenv("DB_CLAIM_THREADS", "8"))
+DEFAULT_ROOM_ID = bingo_db.DEFAULT_ROOM_ID
+
+_pools = {}      # (name, pid) -> ThreadPool
+
+
+def _pool(name, size):
+    # Created on first use, after the worker has forked and been patched.
+    key = (name, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = ThreadPool(size)
+    return pool
+
+
+def _offload(name, size, fn):
+    if monkey is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not monkey.is_module_patched("threading"):
+            return fn(*args, **kwargs)
+        return _pool(name, size).apply(fn, args, kwargs)
+    return wrapper
+
+
+def _read(fn):
+    return _offload("read", DB_READ_THREADS, fn)
+
+
+def _write(fn):
+    return _offload("write", 1, fn)
+
+
+# ----- Reads -----
+get_rooms = _read(bingo_db.get_rooms)
+get_room = _read(bingo_db.get_room)
+get_cardboard_response = _read(bingo_db.get_cardboard_response)
+get_card_state = _read(bingo_db.get_card_state)
+get_available_cards = _read(bingo_db.get_available_cards)
+get_available_cards_since = _read(bingo_db.get_available_cards_since)
+get_round_state = _read(bingo_db.get_round_state)
+get_round_result = _read(bingo_db.get_round_result)
+
+# ----- Writes -----
+buy_card = _write(bingo_db.buy_card)
+buy_cards = _write(bingo_db.buy_cards)
+
+# Win claims wait for each other inside bingo_db (see claim_win).
+claim_win = _offload("claim", DB_CLAIM_THREADS, bingo_db.claim_win)
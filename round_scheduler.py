@@ -0,0 +1,178 @@
+"""Round scheduler running inside the bot's asyncio event loop.
+
+Keeps a heap of timers per round: the next number call (every
+CALL_INTERVAL_SECONDS) and the round's timeout at its exact deadline.  Paused
+rounds draw nothing and do not time out until resumed.  On start the timers are
+rebuilt from the active rows in game_rounds, so a restart picks up where the
+previous process left off.
+
+Every room's active round is driven independently.  SCHEDULER_ROOMS (e.g.
+"1,3") limits a process to some rooms, so rooms can be spread over several
+bot processes; empty means all rooms.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+import async_db as db
+
+CALL_INTERVAL_SECONDS = float(os.getenv("CALL_INTERVAL_SECONDS", "10"))
+SCHEDULER_ROOMS = [int(room) for room in os.getenv("SCHEDULER_ROOMS", "").split(",") if room.strip()]
+
+logger = logging.getLogger(__name__)
+
+CALL = "call"
+TIMEOUT = "timeout"
+CHECK = "check"       # one-off look at the round's status, nothing is drawn
+
+
+class RoundScheduler:
+    def __init__(self, call_interval=CALL_INTERVAL_SECONDS, on_event=None, rooms=SCHEDULER_ROOMS):
+        """on_event(kind, room_id, round_id, payload) is awaited after every call and
+        round end (kind "call", "round_end" or "winner"; payload the number or a message)."""
+        self.call_interval = call_interval
+        self.on_event = on_event
+        self.rooms = set(rooms or ())        # empty = every room
+        self._heap = []              # (when, seq, kind, round_id)
+        self._seq = itertools.count()
+        self._scheduled = set()      # round ids with timers on the heap
+        self._call_seq = {}          # round id -> seq of its one live call timer
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # ----- lifecycle -----
+    async def start(self):
+        await self._schedule_active_rounds()
+        self._task = asyncio.create_task(self._run(), name="round-scheduler")
+        logger.info("Round scheduler started for rounds %s", sorted(self._scheduled))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Re-examine timers now (e.g. after /resume or a new round)."""
+        self._wakeup.set()
+
+    async def resume(self, round_id):
+        await db.resume_round(round_id)
+        self._push(time.time(), CALL, round_id)
+        self.wake()
+
+    def check(self, round_id):
+        """Look at the round now (e.g. after a win claim) instead of at its next call."""
+        if round_id in self._scheduled:
+            self._push(time.time(), CHECK, round_id)
+            self.wake()
+
+    # ----- timers -----
+    def _push(self, when, kind, round_id):
+        seq = next(self._seq)
+        if kind == CALL:
+            # Re-arming a call replaces the previous timer instead of adding a second one.
+            self._call_seq[round_id] = seq
+        heapq.heappush(self._heap, (when, seq, kind, round_id))
+
+    def _schedule_round(self, state):
+        if state.id in self._scheduled or (self.rooms and state.room_id not in self.rooms):
+            return
+        self._scheduled.add(state.id)
+        self._push(time.time() + self.call_interval, CALL, state.id)
+        self._push(state.deadline, TIMEOUT, state.id)
+
+    def _forget(self, round_id):
+        # Leftover timers of the round are skipped: TIMEOUT via the state check,
+        # CALL via the missing sequence number.
+        self._scheduled.discard(round_id)
+        self._call_seq.pop(round_id, None)
+
+    async def _schedule_active_rounds(self):
+        for state in await db.get_active_rounds():
+            self._schedule_round(state)
+
+    async def _run(self):
+        next_scan = time.time() + self.call_interval
+        while True:
+            self._wakeup.clear()
+            # Besides the timers, look for new active rounds (new rooms, rounds
+            # started by another process) once per interval.
+            due = min(self._heap[0][0], next_scan) if self._heap else next_scan
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if due == next_scan:
+                next_scan = time.time() + self.call_interval
+                try:
+                    await self._schedule_active_rounds()
+                except Exception:
+                    logger.exception("Scheduler scan for active rounds failed")
+                continue
+            _, seq, kind, round_id = heapq.heappop(self._heap)
+            if kind == CALL and self._call_seq.get(round_id) != seq:
+                continue
+            try:
+                await self._fire(kind, round_id)
+            except Exception:
+                logger.exception("Scheduler %s for round %s failed", kind, round_id)
+                self._push(time.time() + self.call_interval, kind, round_id)
+
+    async def _fire(self, kind, round_id):
+        state = await db.get_round_state(round_id)
+        if not state or state.status != 'active':
+            # Round ended elsewhere (winner claim, reset, other process): the
+            # first leftover timer announces the result, later ones are ignored.
+            announce = state is not None and round_id in self._scheduled
+            self._forget(round_id)
+            if announce:
+                result = await db.get_round_result(round_id)
+                if result and result["winner"]:
+                    await self._notify("winner", state, f"🏆 won by {result['winner']}!")
+                else:
+                    await self._notify("round_end", state, state.status)
+            await self._schedule_active_rounds()
+            return
+        if kind == CHECK:
+            return
+
+        if state.is_paused:
+            # Check again later; resume() re-arms the call timer immediately.
+            self._push(time.time() + self.call_interval, kind, round_id)
+            return
+
+        if kind == TIMEOUT:
+            if not state.expired():
+                # Deadline moved (set_round_duration); re-arm at the new one.
+                self._push(state.deadline, TIMEOUT, round_id)
+                return
+            result = await db.check_round_timeout(round_id)
+            self._forget(round_id)
+            if result:
+                logger.info("Round %s timed out: %s", round_id, result)
+                await self._notify("round_end", state, result)
+            await self._schedule_active_rounds()
+            return
+
+        number = await db.call_number(round_id)
+        if number is not None:
+            await self._notify("call", state, number)
+        if state.draw_cursor < 75:
+            self._push(time.time() + self.call_interval, CALL, round_id)
+
+    async def _notify(self, kind, state, payload):
+        if self.on_event:
+            try:
+                await self.on_event(kind, state.room_id, state.id, payload)
+            except Exception:
+                logger.exception("Scheduler listener failed for %s", kind)
@@ -0,0 +1,174 @@
+"""In-process broadcasters behind the /api/round/stream Server-Sent Events endpoint.
+
+Numbers are usually called by the bot process, so one poller thread per room
+and API process watches the cached round state (which only re-reads SQLite after
+another connection commits) and turns differences into events.  Each event is
+formatted once and handed to every connected client, so the cost of a call is
+one fan-out no matter how many cards are open.  Clients only ever wait on the
+broadcaster and read its state (snapshots come from what the poller last saw),
+never SQLite, so under the API's gevent worker an open card costs one idle
+greenlet rather than a thread and a database connection.  The poller reads
+through green_db, off the hub.
+
+Event ids are "<epoch>:<counter>".  A client reconnecting with a Last-Event-ID
+from this process gets the events it missed; anything else (another worker, a
+restart, history already dropped) gets a fresh snapshot first.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+import bingo_db
+import green_db
+
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "0.5"))
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_HISTORY = 512
+
+
+class RoundBroadcaster:
+    def __init__(self, room_id=bingo_db.DEFAULT_ROOM_ID, poll_interval=STREAM_POLL_SECONDS,
+                 history=STREAM_HISTORY):
+        self.room_id = room_id
+        self.poll_interval = poll_interval
+        self.epoch = secrets.token_hex(4)
+        self._counter = 0
+        self._events = deque(maxlen=history)    # (counter, formatted bytes)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._round_id = None
+        self._status = None
+        self._paused = None
+        self._called = []                       # called numbers already published
+
+    # ----- publishing -----
+    def _format(self, counter, event, data):
+        payload = json.dumps(data, separators=(",", ":"))
+        return f"id: {self.epoch}:{counter}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+    def publish(self, event, data):
+        with self._cond:
+            self._counter += 1
+            self._events.append((self._counter, self._format(self._counter, event, data)))
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """The round as published so far; taken under self._cond together with the
+        event counter, so a client resumes exactly after it."""
+        return {"room_id": self.room_id, "round_id": self._round_id, "status": self._status,
+                "paused": bool(self._paused), "called": list(self._called)}
+
+    # ----- polling -----
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                try:
+                    self.poll()     # so the first client's snapshot is current
+                except Exception as e:
+                    print(f"⚠️ Round stream poll failed: {e}")
+                self._thread = threading.Thread(target=self._poll_forever, daemon=True,
+                                                name=f"round-stream-{self.room_id}")
+                self._thread.start()
+
+    def _poll_forever(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️ Round stream poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        # Only the poller changes the published state; SQLite is read first and
+        # the events and snapshot state are then updated in one step.
+        state = green_db.get_round_state(room_id=self.room_id)
+        round_id = state.id if state else None
+        previous = result = None
+        if round_id != self._round_id and self._round_id is not None:
+            previous = green_db.get_round_state(self._round_id)
+            result = green_db.get_round_result(self._round_id)
+        with self._cond:
+            if round_id != self._round_id:
+                if previous:
+                    self._publish_calls(previous)
+                if result and result["winner"]:
+                    self.publish("winner", result)
+                elif result:
+                    self.publish("round", {"round_id": self._round_id, "status": result["status"],
+                                           "paused": False})
+                self._round_id, self._called = round_id, []
+                self._status = self._paused = None
+            if not state:
+                return
+            if (state.status, state.is_paused) != (self._status, self._paused):
+                self._status, self._paused = state.status, state.is_paused
+                self.publish("round", {"round_id": round_id, "status": state.status, "paused": state.is_paused})
+            self._publish_calls(state)
+
+    def _publish_calls(self, state):
+        called = state.called
+        for index in range(len(self._called), len(called)):
+            self.publish("call", {"round_id": state.id, "number": called[index], "index": index + 1})
+            self._called.append(called[index])
+
+    # ----- consuming -----
+    def _missed(self, last_event_id):
+        """Events after last_event_id, or None if they cannot be replayed."""
+        epoch, _, counter = (last_event_id or "").partition(":")
+        if epoch != self.epoch or not counter.isdigit():
+            return None
+        counter = int(counter)
+        with self._cond:
+            if counter > self._counter:
+                return None     # not an id this broadcaster handed out
+            if counter < self._counter and (not self._events or self._events[0][0] > counter + 1):
+                return None
+            return [event for event in self._events if event[0] > counter]
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE chunks for one client."""
+        self.start()
+        yield b"retry: 3000\n\n"
+        missed = self._missed(last_event_id)
+        if missed is None:
+            with self._cond:
+                cursor = self._counter
+                chunk = self._format(cursor, "snapshot", self.snapshot())
+            yield chunk
+        else:
+            cursor = missed[-1][0] if missed else int(last_event_id.partition(":")[2])
+            for _, chunk in missed:
+                yield chunk
+        while True:
+            with self._cond:
+                if cursor >= self._counter:
+                    self._cond.wait(STREAM_KEEPALIVE_SECONDS)
+                pending = [event for event in self._events if event[0] > cursor]
+                if self._events and self._events[0][0] > cursor + 1:
+                    pending = None      # fell behind the history window
+            if pending is None:
+                with self._cond:
+                    cursor = self._counter
+                    chunk = self._format(cursor, "snapshot", self.snapshot())
+                yield chunk
+            elif not pending:
+                yield b": keepalive\n\n"
+            else:
+                for counter, chunk in pending:
+                    yield chunk
+                cursor = pending[-1][0]
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+def get_broadcaster(room_id=bingo_db.DEFAULT_ROOM_ID):
+    """The process-wide broadcaster of a room, created on first use."""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(room_id)
+        if broadcaster is None:
+            broadcaster = _broadcasters[room_id] = RoundBroadcaster(room_id)
+        return broadcaster